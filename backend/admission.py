@@ -0,0 +1,190 @@
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from config import ADMISSION_DEPTHS, ADMISSION_LATENCY_TARGET
+from tracing import samples_lock, stage_in_flight
+
+# Operating modes from normal to most degraded, each mode also applies the degradations before it
+MODES = ["normal", "skip_review", "draft", "cache_only", "reject"]
+# Calls in flight of a stage (or group of stages) from which a mode starts
+STAGE_LIMITS = [
+    ("qwen_model", 8, "skip_review"),
+    ("generate_image", 3, "draft"),
+    ("generate_3D_model", 3, "cache_only"),
+]
+# Number of recent utterances whose latency is compared to the latency target
+LATENCY_WINDOW = 20
+# Latencies older than this stop counting, so an idle server returns to normal, in seconds
+LATENCY_MAX_AGE = 60
+# Retry delay suggested to rejected clients when no utterance has finished yet, in seconds
+DEFAULT_RETRY_AFTER = 10
+
+
+# Admission of the utterance handled in the current context: the level of its mode and the objects it skipped
+current_admission = contextvars.ContextVar("current_admission", default=None)
+
+
+class Overloaded(Exception):
+    """Raised when an utterance cannot be handled in the current mode."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"The server is busy, please try again in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Tracks the utterances in flight, the calls in flight of each stage and the recent utterance latencies,
+    and switches to degraded modes when they cross their thresholds.
+    The mode of an utterance is decided once when it is admitted, so every task of a request runs in the same mode.
+    """
+
+    def __init__(self, depths=ADMISSION_DEPTHS, latency_target=ADMISSION_LATENCY_TARGET):
+        self.depths = depths
+        self.latency_target = latency_target
+        self.lock = threading.Lock()
+        # Batch jobs turn degradation off, they favor quality over latency
+        self.enabled = True
+        self.in_flight = 0
+        self.rejected = 0
+        self.level = 0
+        # Finish time and latency of the recent utterances
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def mode(self):
+        return MODES[self.level]
+
+    def _recent_latencies(self):
+        cutoff = time.monotonic() - LATENCY_MAX_AGE
+        with self.lock:
+            return [latency for finished, latency in self.latencies if finished >= cutoff]
+
+    def _stage_depths(self):
+        with samples_lock:
+            in_flight = dict(stage_in_flight)
+        return {
+            prefix: sum(count for stage, count in in_flight.items() if stage == prefix or stage.startswith(f"{prefix}."))
+            for prefix, _, _ in STAGE_LIMITS
+        }
+
+    def update(self):
+        """
+        Recompute the mode from the current load.
+        Returns:
+            str: The current mode.
+        """
+        if not self.enabled:
+            return self.mode
+        with self.lock:
+            in_flight = self.in_flight
+        # Utterances in flight can lead to any mode
+        level = sum(in_flight >= depth for depth in self.depths)
+        # A congested stage degrades the work it is responsible for
+        stage_depths = self._stage_depths()
+        for prefix, limit, mode in STAGE_LIMITS:
+            if stage_depths[prefix] >= limit:
+                level = max(level, MODES.index(mode))
+        # Slow utterances degrade one mode per multiple of the target, but never lead to rejections
+        latencies = self._recent_latencies()
+        if latencies and self.latency_target > 0:
+            level = max(level, min(int(np.percentile(latencies, 95) // self.latency_target), MODES.index("cache_only")))
+
+        with self.lock:
+            if level != self.level:
+                print(f"Admission mode: {MODES[self.level]} -> {MODES[level]}")
+                self.level = level
+        return self.mode
+
+    def degraded(self, mode):
+        """
+        Check whether a degraded mode applies to the current utterance, in the mode it was admitted with.
+        Outside an admitted utterance (e.g. batch builds), the current mode applies.
+        Args:
+            mode (str): One of MODES.
+        Returns:
+            bool: True if the mode is at least as degraded.
+        """
+        admitted = current_admission.get()
+        level = admitted["level"] if admitted is not None else MODES.index(self.update())
+        return level >= MODES.index(mode)
+
+    def retry_after(self):
+        """
+        Suggest when a rejected client should try again: about the time it takes for an utterance to finish.
+        Returns:
+            int: Delay in seconds.
+        """
+        latencies = self._recent_latencies()
+        if not latencies:
+            return DEFAULT_RETRY_AFTER
+        return min(max(math.ceil(float(np.median(latencies))), 1), 300)
+
+    def admit(self):
+        """
+        Admit a new utterance in the current mode, counting it as in flight until release is called.
+        Returns:
+            dict: The admission of the utterance, also set in the current context: its mode level
+                and the objects skipped because only existing assets could be used.
+        Raises:
+            Overloaded: If the server is rejecting new utterances.
+        """
+        level = MODES.index(self.update())
+        if level >= MODES.index("reject"):
+            with self.lock:
+                self.rejected += 1
+            raise Overloaded(self.retry_after())
+        with self.lock:
+            self.in_flight += 1
+        admitted = {"level": level, "skipped": []}
+        current_admission.set(admitted)
+        return admitted
+
+    def skip(self, name):
+        """
+        Record an object left out of the current utterance because it has no existing asset in cache_only mode.
+        Args:
+            name (str): The name of the object.
+        """
+        admitted = current_admission.get()
+        if admitted is not None:
+            admitted["skipped"].append(name)
+        print(f"Skipped {name}: no existing asset while only existing assets are used")
+
+    def release(self, latency=None):
+        """
+        Mark an admitted utterance as finished.
+        Args:
+            latency (float or None): Duration of the utterance in seconds, compared to the latency target.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if latency is not None:
+                self.latencies.append((time.monotonic(), latency))
+        self.update()
+
+    def status(self):
+        """
+        Current mode and load, exposed on /metrics.
+        Returns:
+            dict: The mode, its level, the utterances in flight and the number of rejected utterances.
+        """
+        mode = self.update()
+        stage_depths = self._stage_depths()
+        with self.lock:
+            return {
+                "mode": mode,
+                "level": self.level,
+                "utterances_in_flight": self.in_flight,
+                "stages_in_flight": stage_depths,
+                "rejected": self.rejected,
+            }
+
+
+# Admission controller shared by every connection of this process
+admission = AdmissionController()
@@ -0,0 +1,160 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import wave
+
+import numpy as np
+
+from config import ASR_MODEL, ASR_THREADS
+
+SAMPLE_RATE = 16000
+
+
+def load_clip(audio_path):
+    """
+    Load a 16-bit PCM .wav clip as mono float32 audio at 16 kHz, the format sent by the VR client.
+    Args:
+        audio_path (str): Path to the clip.
+    Returns:
+        np.ndarray: The audio samples.
+    """
+    with wave.open(audio_path, "rb") as wav_file:
+        channels, sample_rate = wav_file.getnchannels(), wav_file.getframerate()
+        pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+    audio = pcm.astype(np.float32).reshape(-1, channels).mean(axis=1) / 32768.0
+    if sample_rate != SAMPLE_RATE:
+        # Linear resampling is enough for speech at these rates
+        duration = len(audio) / sample_rate
+        times = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        audio = np.interp(times, np.arange(len(audio)) / sample_rate, audio).astype(np.float32)
+    return audio
+
+
+def load_clips(clips_dir):
+    """
+    Load the clip set: every .wav file with its reference transcription in a .txt file of the same name.
+    Args:
+        clips_dir (str): Directory containing the clips.
+    Returns:
+        list: The clips with their name, audio, duration and reference.
+    """
+    clips = []
+    for audio_path in sorted(glob.glob(os.path.join(clips_dir, "*.wav"))):
+        reference_path = os.path.splitext(audio_path)[0] + ".txt"
+        if not os.path.exists(reference_path):
+            print(f"Skipping {audio_path}: no reference transcription")
+            continue
+        with open(reference_path, "r") as f:
+            reference = f.read().strip()
+        audio = load_clip(audio_path)
+        clips.append({
+            "name": os.path.basename(audio_path),
+            "audio": audio,
+            "duration": len(audio) / SAMPLE_RATE,
+            "reference": reference,
+        })
+    return clips
+
+
+def normalize(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """
+    Count the word-level edits (substitutions, insertions, deletions) between two transcriptions.
+    Args:
+        reference (str): The reference transcription.
+        hypothesis (str): The recognized transcription.
+    Returns:
+        tuple: Number of errors and number of reference words.
+    """
+    reference_words, hypothesis_words = normalize(reference), normalize(hypothesis)
+    distances = np.arange(len(hypothesis_words) + 1)
+    for i, reference_word in enumerate(reference_words, start=1):
+        previous, distances = distances, np.empty_like(distances)
+        distances[0] = i
+        for j, hypothesis_word in enumerate(hypothesis_words, start=1):
+            distances[j] = min(previous[j] + 1, distances[j - 1] + 1,
+                               previous[j - 1] + (reference_word != hypothesis_word))
+    return int(distances[-1]), len(reference_words)
+
+
+def benchmark_backend(backend, clips, model_id, num_threads):
+    """
+    Transcribe the clip set with one ASR backend.
+    Args:
+        backend (str): The ASR backend, see whisper.create_whisper_pipe.
+        clips (list): The clips returned by load_clips.
+        model_id (str): The Whisper model.
+        num_threads (int): Number of CPU threads, 0 keeps the default.
+    Returns:
+        dict: Load time, real-time factor, WER and per-clip results.
+    """
+    from whisper import create_whisper_pipe
+
+    start = time.perf_counter()
+    pipe = create_whisper_pipe(backend, model_id, num_threads)
+    load_time = time.perf_counter() - start
+    # The first call initializes kernels and caches, keep it out of the measurements
+    pipe(clips[0]["audio"], return_timestamps=False)
+
+    results = []
+    for clip in clips:
+        start = time.perf_counter()
+        transcription = pipe(clip["audio"], return_timestamps=False)["text"].strip()
+        elapsed = time.perf_counter() - start
+        errors, words = word_errors(clip["reference"], transcription)
+        results.append({
+            "clip": clip["name"],
+            "duration": clip["duration"],
+            "time": elapsed,
+            "errors": errors,
+            "words": words,
+            "transcription": transcription,
+        })
+
+    total_time = sum(result["time"] for result in results)
+    total_duration = sum(result["duration"] for result in results)
+    return {
+        "backend": backend,
+        "load_time": load_time,
+        "rtf": total_time / total_duration,
+        "wer": sum(result["errors"] for result in results) / max(sum(result["words"] for result in results), 1),
+        "results": results,
+    }
+
+
+def print_report(reports):
+    print("\nBackend          load (s)      RTF      WER")
+    for report in reports:
+        print(f"{report['backend']:<16} {report['load_time']:>8.1f} {report['rtf']:>8.3f} {report['wer'] * 100:>7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the real-time factor and WER of the ASR backends.")
+    parser.add_argument("--clips-dir", default="../data/asr_clips", help="Directory with .wav clips and .txt reference transcriptions.")
+    parser.add_argument("--backends", nargs="+", default=["transformers", "int8", "onnx"], help="ASR backends to compare.")
+    parser.add_argument("--model", default=ASR_MODEL, help="Whisper model.")
+    parser.add_argument("--threads", type=int, default=ASR_THREADS, help="Number of CPU threads, 0 keeps the default.")
+    parser.add_argument("--output", help="Save the full report as JSON.")
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips_dir)
+    if not clips:
+        raise SystemExit(f"No clips found in {args.clips_dir}")
+    print(f"{len(clips)} clips, {sum(clip['duration'] for clip in clips):.1f} s of audio")
+
+    reports = []
+    for backend in args.backends:
+        try:
+            reports.append(benchmark_backend(backend, clips, args.model, args.threads))
+        except Exception as e:
+            print(f"Error benchmarking the {backend} backend: {e}")
+    print_report(reports)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,261 @@
+import glob
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import trimesh
+from PIL import Image, ImageColor
+
+from tracing import traced
+
+# Colors an asset can be recolored to. Other color names ("tan", "snow", "chocolate") are too
+# often part of the object itself to be read as a color
+BASIC_COLORS = {"red", "orange", "yellow", "green", "blue", "purple", "pink", "brown", "black", "white", "gray", "grey"}
+# Uniform scale applied for the size words of a request
+SIZE_WORDS = {
+    "tiny": 0.5,
+    "small": 0.75,
+    "little": 0.75,
+    "big": 1.5,
+    "large": 1.5,
+    "huge": 2.0,
+    "giant": 2.0,
+}
+
+
+class AssetLibrary:
+    """
+    Name index over the generated models, used to reuse an existing mesh instead of generating a new one.
+    Built from the scene records (name, color and path) and the .glb files in the models directory.
+    """
+
+    def __init__(self, models_dir="../models", data_dir="../data"):
+        self.models_dir = models_dir
+        self.lock = threading.Lock()
+        # Assets by object name, each asset is {"name", "color", "path", "lods"} with frontend paths
+        self.assets = {}
+
+        records = []
+        for models_file in [os.path.join(data_dir, "models.json")] + sorted(glob.glob(os.path.join(data_dir, "scenes", "*", "models.json"))):
+            try:
+                with open(models_file, "r") as f:
+                    records.extend(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Error loading {models_file}: {e}")
+
+        indexed = set()
+        for record in records:
+            # Variants are derived from another asset and drafts are generated under load, neither is reused
+            if record.get("path") and record["path"] not in indexed:
+                indexed.add(record["path"])
+                if not record.get("source") and not record.get("draft"):
+                    self.add(record["name"], record.get("color"), record["path"], record.get("lods"))
+
+        # Models without a record are indexed by the name in their file name
+        for model_path in sorted(glob.glob(os.path.join(models_dir, "*.glb"))):
+            path = f"../{model_path}"
+            if path not in indexed:
+                stem = os.path.splitext(os.path.basename(model_path))[0]
+                self.add(re.match(r"^(.*?)\d*$", stem).group(1), None, path)
+
+    def add(self, name, color, path, lods=None):
+        """
+        Add a generated model to the index.
+        Args:
+            name (str): The name of the object.
+            color (str or None): The color of the object, if known.
+            path (str): Path to the .glb file, as seen by the frontend.
+            lods (list or None): Paths of its LOD variants.
+        """
+        if not os.path.exists(path.replace("../../", "../", 1)):
+            return
+        with self.lock:
+            self.assets.setdefault(name, []).append({"name": name, "color": color, "path": path, "lods": lods or []})
+
+    def set_lods(self, path, lods):
+        """
+        Record the LOD variants generated for an indexed model, so they are reused with it.
+        Args:
+            path (str): Path to the .glb file, as seen by the frontend.
+            lods (list): Paths of its LOD variants.
+        """
+        with self.lock:
+            for assets in self.assets.values():
+                for asset in assets:
+                    if asset["path"] == path:
+                        asset["lods"] = list(lods)
+
+    def snapshot(self):
+        """
+        Get every indexed asset, e.g. to record the library with a captured session.
+        Returns:
+            list: The assets.
+        """
+        with self.lock:
+            return [dict(asset) for assets in self.assets.values() for asset in assets]
+
+    def find(self, name):
+        """
+        Find an asset with the same object name, in singular or plural form.
+        Args:
+            name (str): The name of the object to create.
+        Returns:
+            dict or None: The asset, or None if there is no asset with that name.
+        """
+        # Similar names are often different objects ("char" and "chair"), so only plurals are matched
+        candidates = [name, f"{name}s", f"{name}es"]
+        if name.endswith("es"):
+            candidates.append(name[:-2])
+        if name.endswith("s"):
+            candidates.append(name[:-1])
+        with self.lock:
+            match = next((candidate for candidate in candidates if candidate in self.assets), None)
+            return dict(self.assets[match][0]) if match else None
+
+
+def attribute_words(description, name):
+    # Words of the description that are not part of the object name ("orange" in "orange" is the fruit)
+    name_words = set(re.findall(r"[a-z]+", name.lower()))
+    return [word for word in re.findall(r"[a-z]+", description.lower()) if word not in name_words]
+
+
+def requested_color(description, name):
+    """
+    Get the color of an object description, e.g. "blue chair" -> "blue".
+    Args:
+        description (str): The description of the object to create, e.g. from describe_object.
+        name (str): The name of the object.
+    Returns:
+        str or None: The color name, or None if no basic color is named.
+    """
+    return next((word for word in attribute_words(description, name) if word in BASIC_COLORS), None)
+
+
+def requested_scale(description, name):
+    """
+    Get the uniform scale for the size words of an object description, e.g. "big chair" -> 1.5.
+    Args:
+        description (str): The description of the object to create, e.g. from describe_object.
+        name (str): The name of the object.
+    Returns:
+        float: The scale factor.
+    """
+    return next((SIZE_WORDS[word] for word in attribute_words(description, name) if word in SIZE_WORDS), 1.0)
+
+
+def recolor_pixels(rgb, color):
+    """
+    Shift colors toward a target color, keeping the relative shading of the original.
+    Args:
+        rgb (np.ndarray): N x 3 array of RGB values (0-255).
+        color (str): The target color name.
+    Returns:
+        np.ndarray: The recolored RGB values.
+    """
+    target = Image.new("RGB", (1, 1), ImageColor.getrgb(color)).convert("HSV").getpixel((0, 0))
+    hsv = np.array(Image.fromarray(rgb.reshape(1, -1, 3).astype(np.uint8)).convert("HSV"), dtype=float)
+    # Take hue and saturation from the target, and scale brightness so its mean matches the target
+    hsv[..., 0] = target[0]
+    hsv[..., 1] = target[1]
+    hsv[..., 2] *= target[2] / max(hsv[..., 2].mean(), 1.0)
+    hsv = np.clip(hsv, 0, 255).astype(np.uint8)
+    return np.array(Image.fromarray(hsv, "HSV").convert("RGB")).reshape(-1, 3)
+
+
+def recolor_texture(image, color):
+    """
+    Recolor a texture toward a target color, keeping its transparency.
+    Args:
+        image (PIL.Image): The texture image.
+        color (str): The target color name.
+    Returns:
+        PIL.Image: The recolored texture.
+    """
+    rgba = np.array(image.convert("RGBA"))
+    rgba[..., :3] = recolor_pixels(rgba[..., :3].reshape(-1, 3), color).reshape(rgba.shape[:2] + (3,))
+    recolored = Image.fromarray(rgba, "RGBA")
+    return recolored if image.mode in ("RGBA", "LA") else recolored.convert("RGB")
+
+
+def recolor_mesh(mesh, color):
+    """
+    Recolor a mesh in place, through its texture, its vertex/face colors or its material color.
+    Args:
+        mesh (trimesh.Trimesh): The mesh to recolor.
+        color (str): The target color name.
+    """
+    visual = mesh.visual
+    if isinstance(visual, trimesh.visual.TextureVisuals):
+        material = visual.material.copy()
+        if getattr(material, "baseColorTexture", None) is not None:
+            material.baseColorTexture = recolor_texture(material.baseColorTexture, color)
+        elif getattr(material, "image", None) is not None:
+            material.image = recolor_texture(material.image, color)
+        else:
+            material.baseColorFactor = list(ImageColor.getrgb(color)) + [255]
+        mesh.visual = trimesh.visual.TextureVisuals(uv=visual.uv, material=material)
+    elif visual.kind == "vertex":
+        colors = visual.vertex_colors.copy()
+        colors[:, :3] = recolor_pixels(colors[:, :3], color)
+        mesh.visual = trimesh.visual.ColorVisuals(mesh, vertex_colors=colors)
+    elif visual.kind == "face":
+        colors = visual.face_colors.copy()
+        colors[:, :3] = recolor_pixels(colors[:, :3], color)
+        mesh.visual = trimesh.visual.ColorVisuals(mesh, face_colors=colors)
+    else:
+        mesh.visual.face_colors = list(ImageColor.getrgb(color)) + [255]
+
+
+@traced("create_variant")
+def create_variant(asset, description, name, object_id):
+    """
+    Create a variant of an existing asset for an object, recolored toward its color and uniformly scaled.
+    The asset is reused as is when no color or size change is described.
+    Args:
+        asset (dict): The asset returned by AssetLibrary.find.
+        description (str): The description of the object only, not the whole request, so that
+            "a chair next to the red table" does not make the chair red.
+        name (str): The name of the object.
+        object_id (str): Name of the object, used for the variant's file name.
+    Returns:
+        str: Path to the model file, as seen by the frontend.
+        str or None: The color of the object.
+        list: Paths of the LOD variants of the reused asset, empty for a new variant.
+    """
+    color = requested_color(description, name)
+    scale = requested_scale(description, name)
+    if (color is None or color == asset["color"]) and scale == 1.0:
+        return asset["path"], asset["color"], asset["lods"]
+
+    scene = trimesh.load(asset["path"].replace("../../", "../", 1), force="scene")
+    if color is not None:
+        for mesh in scene.geometry.values():
+            if isinstance(mesh, trimesh.Trimesh):
+                recolor_mesh(mesh, color)
+    if scale != 1.0:
+        scene.apply_scale(scale)
+
+    output_path = f"../models/{object_id}.glb".replace(" ", "_")
+    scene.export(output_path, file_type="glb")
+    print(f"Variant of {asset['path']} saved to {output_path}")
+    return f"../{output_path}", color or asset["color"], []
+
+
+# Asset library of the generated models, indexed on first use
+asset_library = None
+asset_library_lock = threading.Lock()
+
+
+def load_asset_library():
+    """
+    Index the asset library if it is not indexed yet.
+    Returns:
+        AssetLibrary: The asset library.
+    """
+    global asset_library
+    with asset_library_lock:
+        if asset_library is None:
+            asset_library = AssetLibrary()
+    return asset_library
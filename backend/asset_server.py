@@ -0,0 +1,246 @@
+import gzip
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+
+from config import ASSET_COMPRESSION
+
+# Brotli is optional, gzip is used when it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Directories served under /assets/<name>/
+ASSET_DIRS = {"models": "../models", "images": "../images"}
+MEDIA_TYPES = {".glb": "model/gltf-binary", ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+# Only GLB files are worth compressing, images are already compressed
+COMPRESSIBLE = {".glb"}
+# Larger files are streamed as is instead of being compressed in memory
+MAX_COMPRESSED_SIZE = 64 * 2**20
+CHUNK_SIZE = 2**20
+# Content-hash URLs never change, plain URLs are revalidated with their ETag
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+router = APIRouter()
+# Content hash of each file, recomputed when its size or modification time changes
+digests = {}
+digests_lock = threading.Lock()
+
+
+def relative_path(path):
+    # Paths stored in the scene are relative to the frontend, e.g. "../../models/chair1.glb"
+    return re.sub(r"^(\.\./)+", "", path or "")
+
+
+def resolve_asset(asset_path):
+    """
+    Map an asset path to the file it refers to, without leaving the asset directories.
+    Args:
+        asset_path (str): Path like "models/chair1.glb", or as stored in the scene ("../../models/chair1.glb").
+    Returns:
+        str or None: The file path, or None if it is not a served asset.
+    """
+    directory, _, file_name = relative_path(asset_path).partition("/")
+    if directory not in ASSET_DIRS or not file_name:
+        return None
+    root = os.path.realpath(ASSET_DIRS[directory])
+    file_path = os.path.realpath(os.path.join(root, file_name))
+    if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+        return None
+    return file_path
+
+
+def file_digest(file_path):
+    """
+    Get the content hash of a file.
+    Args:
+        file_path (str): Path to the file.
+    Returns:
+        str: The first 16 hex digits of its SHA-256.
+    """
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with digests_lock:
+        cached = digests.get(file_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()[:16]
+    with digests_lock:
+        digests[file_path] = (key, digest)
+    return digest
+
+
+def asset_url(path):
+    """
+    Get the content-hash URL of an asset, which can be cached forever.
+    Args:
+        path (str): Path of the asset as stored in the scene, e.g. "../../models/chair1.glb".
+    Returns:
+        str or None: The URL, e.g. "/assets/<hash>/models/chair1.glb", or None if the file does not exist.
+    """
+    file_path = resolve_asset(path)
+    if file_path is None:
+        return None
+    return f"/assets/{file_digest(file_path)}/{relative_path(path)}"
+
+
+def scene_manifest(models):
+    """
+    Build the manifest of a scene: its records with the content-hash URL of their model and LODs,
+    and the list of every asset so the client can prefetch them in parallel.
+    Args:
+        models (list): The records of the scene.
+    Returns:
+        dict: The manifest.
+    """
+    records, assets = [], {}
+    for model in models:
+        record = dict(model)
+        record["url"] = asset_url(model.get("path"))
+        record["lod_urls"] = [url for url in map(asset_url, model.get("lods") or []) if url]
+        if isinstance(model.get("placeholder"), dict) and model["placeholder"].get("src"):
+            record["placeholder"] = dict(model["placeholder"], src=asset_url(model["placeholder"]["src"]))
+        for url, path in [(record["url"], model.get("path"))] + list(zip(record["lod_urls"], model.get("lods") or [])):
+            if url and url not in assets:
+                assets[url] = os.path.getsize(resolve_asset(path))
+        records.append(record)
+    return {
+        "models": records,
+        "assets": [{"url": url, "size": size} for url, size in assets.items()],
+    }
+
+
+@lru_cache(maxsize=32)
+def compressed(file_path, digest, encoding):
+    # The digest is part of the cache key, so a modified file is compressed again
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def select_encoding(accept_encoding, file_path, size):
+    if not ASSET_COMPRESSION or size > MAX_COMPRESSED_SIZE or os.path.splitext(file_path)[1] not in COMPRESSIBLE:
+        return None
+    accepted = {value.split(";")[0].strip() for value in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def parse_range(range_header, size):
+    """
+    Parse a single byte range request.
+    Args:
+        range_header (str): Value of the Range header, e.g. "bytes=0-1023".
+        size (int): Size of the file.
+    Returns:
+        tuple or None: First and last byte of the range, or None if it cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def read_chunks(file_path, start, end):
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, file_path, digest, cache_control):
+    """
+    Serve a file with ETag revalidation, single byte ranges and optional gzip/brotli compression.
+    Args:
+        request (Request): The HTTP request.
+        file_path (str): Path to the file.
+        digest (str): Content hash of the file.
+        cache_control (str): Value of the Cache-Control header.
+    Returns:
+        Response: The response.
+    """
+    size = os.path.getsize(file_path)
+    media_type = MEDIA_TYPES.get(os.path.splitext(file_path)[1], "application/octet-stream")
+    encoding = select_encoding(request.headers.get("accept-encoding", ""), file_path, size)
+    # Each encoding is a different representation with its own ETag
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [value.strip() for value in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    # Ranges are served from the uncompressed file
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == f'"{digest}"'):
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        headers.update({
+            "ETag": f'"{digest}"',
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+        })
+        return StreamingResponse(read_chunks(file_path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(compressed(file_path, digest, encoding), media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(read_chunks(file_path, 0, size - 1), media_type=media_type, headers=headers)
+
+
+@router.get("/assets/{asset_path:path}")
+def get_asset(asset_path: str, request: Request):
+    """
+    Serve a generated asset, either at its content-hash URL (/assets/<hash>/models/chair1.glb, cached forever)
+    or at its plain URL (/assets/models/chair1.glb, revalidated with its ETag).
+    """
+    digest, _, path = asset_path.partition("/")
+    if not DIGEST_PATTERN.match(digest):
+        digest, path = None, asset_path
+
+    file_path = resolve_asset(path)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    current_digest = file_digest(file_path)
+    if digest is None:
+        return serve_file(request, file_path, current_digest, REVALIDATE)
+    if digest != current_digest:
+        # The file changed since the URL was handed out, point to its current version
+        return RedirectResponse(f"/assets/{current_digest}/{path}", status_code=307, headers={"Cache-Control": REVALIDATE})
+    return serve_file(request, file_path, digest, IMMUTABLE)
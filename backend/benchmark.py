@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+import wave
+
+import numpy as np
+
+def load_script(script_path):
+    """
+    Load a command script, one JSON object per line: {"text": "..."} and optionally "audio",
+    the path to a recording of the command (16-bit PCM .wav or raw float32 .f32 at 16 kHz).
+    Args:
+        script_path (str): Path to the script.
+    Returns:
+        list: The commands with their audio data.
+    """
+    from mock_backends import encode_utterance, register_utterance
+
+    commands = []
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    with open(script_path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            command = json.loads(line)
+            if command.get("audio"):
+                audio_path = os.path.join(script_dir, command["audio"])
+                if audio_path.endswith(".wav"):
+                    with wave.open(audio_path, "rb") as wav_file:
+                        pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+                    audio_data = (pcm.astype(np.float32) / 32768.0).tobytes()
+                else:
+                    audio_data = np.fromfile(audio_path, dtype=np.float32).tobytes()
+                register_utterance(audio_data, command["text"])
+            else:
+                audio_data = encode_utterance(command["text"])
+            commands.append({"text": command["text"], "audio": audio_data})
+    return commands
+
+
+async def run_client(client_id, url, commands, repeat, results):
+    """
+    Simulate a VR client sending every command of the script and answering the server's requests.
+    Args:
+        client_id (int): Index of the client, each client works on its own scene.
+        url (str): WebSocket URL of the backend.
+        commands (list): The commands of the script.
+        repeat (int): Number of times the script is sent.
+        results (list): List where the result of each utterance is appended.
+    """
+    import websockets
+    from connection import HEADLESS_USER
+
+    async with websockets.connect(f"{url}?scene=bench{client_id}", max_size=None) as ws:
+        json.loads(await ws.recv())  # session
+        seq = 1
+        await ws.send(json.dumps({"type": "environment_data", "semanticGraph": [HEADLESS_USER], "version": seq}))
+
+        for command in commands * repeat:
+            start = time.perf_counter()
+            first_response = None
+            await ws.send(command["audio"])
+            while True:
+                data = json.loads(await ws.recv())
+                if first_response is None and data["type"] in ("new_model", "delete_object"):
+                    first_response = time.perf_counter() - start
+                # Objects added or removed by the server are synced back like the VR client does
+                if data["type"] in ("new_model", "model_ready", "delete_object"):
+                    seq += 1
+                    if data["type"] == "delete_object":
+                        op = {"op": "remove", "id": data["object_id"]}
+                    else:
+                        model = data["model"]
+                        node = {key: model.get(key) for key in ("id", "name", "color", "position")}
+                        op = {"op": "add" if data["type"] == "new_model" else "update", "node": node}
+                    await ws.send(json.dumps({"type": "scene_delta", "seq": seq, "ops": [op]}))
+                elif data["type"] == "calculate_position":
+                    await ws.send(json.dumps({"type": "world_position", "position": "0 0.5 -1", "request_id": data["request_id"]}))
+                elif data["type"] == "start_pointing_object":
+                    await ws.send(json.dumps({
+                        "type": "pointing_object",
+                        "object_id": data["disambiguation_candidates"][0],
+                        "request_id": data["request_id"]
+                    }))
+                elif data["type"] == "start_pointing_location":
+                    await ws.send(json.dumps({
+                        "type": "pointing_location",
+                        "position": {"x": 0, "y": 0, "z": -1},
+                        "request_id": data["request_id"]
+                    }))
+                elif data["type"] == "utterance_complete":
+                    results.append({
+                        "client": client_id,
+                        "text": command["text"],
+                        "status": data.get("status"),
+                        "latency": time.perf_counter() - start,
+                        "first_response": first_response,
+                    })
+                    break
+
+
+async def monitor_event_loop(interval=0.05):
+    """Record how late the event loop wakes up from a sleep, as the "event_loop_lag" stage."""
+    from tracing import record
+
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        record("event_loop_lag", time.perf_counter() - start - interval)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(np.max(values))}
+
+
+async def run_benchmark(args, commands):
+    import main
+    import mock_backends
+    from admission import admission
+    from tracing import metrics, stage_samples
+
+    latencies = {stage: getattr(args, f"{stage}_latency") for stage in mock_backends.DEFAULT_LATENCIES}
+    mock_backends.install(latencies)
+    mock_servers = mock_backends.start_mock_servers(latencies, args.qwen_port, args.hunyuan_port)
+
+    server, server_task = await mock_backends.start_backend(main.app, args.port)
+    monitor = asyncio.create_task(monitor_event_loop())
+
+    results = []
+    start = time.perf_counter()
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    await asyncio.gather(*(run_client(i, url, commands, args.repeat, results) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    monitor.cancel()
+    server.should_exit = True
+    await server_task
+    for mock_server in mock_servers:
+        mock_server.should_exit = True
+
+    latencies_e2e = [result["latency"] for result in results]
+    first_responses = [result["first_response"] for result in results if result["first_response"] is not None]
+    return {
+        "clients": args.clients,
+        "utterances": len(results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "rejected": sum(result["status"] == "rejected" for result in results),
+        "partial": sum(result["status"] == "partial" for result in results),
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed,
+        "latency": percentiles(latencies_e2e),
+        "first_response": percentiles(first_responses),
+        "event_loop_lag": percentiles(list(stage_samples["event_loop_lag"])),
+        "stages": metrics(),
+        "admission": admission.status(),
+        "mock_latencies": latencies,
+        "results": results,
+    }
+
+
+def print_report(report):
+    print(f"\nClients: {report['clients']}, utterances: {report['utterances']} ({report['failed']} failed, {report['rejected']} rejected, {report['partial']} partial) in {report['elapsed']:.1f} s")
+    print(f"Throughput: {report['throughput']:.3f} utterances/s")
+    for name in ("latency", "first_response", "event_loop_lag"):
+        values = report[name]
+        if values:
+            print(f"{name}: " + ", ".join(f"{key} {value * 1000:.1f} ms" for key, value in values.items()))
+    print("\nStage                                    count    p50 (ms)    p95 (ms)    p99 (ms)")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<40} {stats['count']:>5} {stats['p50'] * 1000:>11.1f} {stats['p95'] * 1000:>11.1f} {stats['p99'] * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    from mock_backends import DEFAULT_LATENCIES, create_work_dir
+
+    parser = argparse.ArgumentParser(description="Benchmark the backend orchestration with mock model backends.")
+    parser.add_argument("--script", default="../data/benchmark_commands.jsonl", help="Command script (JSON lines).")
+    parser.add_argument("--clients", type=int, default=4, help="Number of simulated VR clients.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of times each client sends the script.")
+    parser.add_argument("--port", type=int, default=8100, help="Port of the backend under test.")
+    parser.add_argument("--qwen-port", type=int, default=8101, help="Port of the Qwen stand-in.")
+    parser.add_argument("--hunyuan-port", type=int, default=8102, help="Port of the Hunyuan3D stand-in.")
+    for stage, latency in DEFAULT_LATENCIES.items():
+        parser.add_argument(f"--{stage}-latency", type=float, default=latency, help=f"Latency of the {stage} stand-in, in seconds.")
+    parser.add_argument("--no-asset-reuse", action="store_true", help="Always generate new models instead of reusing matching assets.")
+    parser.add_argument("--output", help="Save the full report as JSON.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary directory with the generated files.")
+    args = parser.parse_args()
+
+    # Point the backend at the stand-in servers before its modules are imported
+    os.environ["QWEN_SERVER_URL"] = f"http://127.0.0.1:{args.qwen_port}/v1/chat/completions"
+    os.environ["HUNYUAN_SERVER_URL"] = f"http://127.0.0.1:{args.hunyuan_port}/generate"
+    os.environ["PRELOAD_MODELS"] = "0"
+    if args.no_asset_reuse:
+        os.environ["ASSET_REUSE"] = "0"
+
+    commands = load_script(args.script)
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Generated images, models, scenes and traces go to a temporary copy of the project layout
+    work_dir = create_work_dir("voiceto3d_benchmark_")
+
+    try:
+        report = asyncio.run(run_benchmark(args, commands))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print_report(report)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
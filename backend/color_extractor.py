@@ -1,9 +1,28 @@
+import threading
 from PIL import Image
 from transformers import pipeline
 
-# Load the pipeline for VQA with the BLIP model
-color_extractor_pipe = pipeline("visual-question-answering", model="Salesforce/blip-vqa-base", model_kwargs={"cache_dir": "/mnt/shared_models/huggingface/cache/hub"})
+from tracing import traced
 
+# Pipeline for VQA with the BLIP model, loaded on first use
+color_extractor_pipe = None
+color_extractor_lock = threading.Lock()
+
+
+def load_color_extractor():
+    """
+    Load the BLIP VQA pipeline if it is not loaded yet.
+    Returns:
+        Pipeline: The loaded pipeline.
+    """
+    global color_extractor_pipe
+    with color_extractor_lock:
+        if color_extractor_pipe is None:
+            color_extractor_pipe = pipeline("visual-question-answering", model="Salesforce/blip-vqa-base", model_kwargs={"cache_dir": "/mnt/shared_models/huggingface/cache/hub"})
+    return color_extractor_pipe
+
+
+@traced("color_extractor")
 def color_extractor(image_path, object_name):
     """
     Extract the color of the object from the image.
@@ -15,5 +34,5 @@ def color_extractor(image_path, object_name):
     """
     image = Image.open(image_path).convert("RGB")
     question = f"What color is the {object_name} in the image?"    
-    color = color_extractor_pipe(image, question)[0]['answer']
+    color = load_color_extractor()(image, question)[0]['answer']
     return color
\ No newline at end of file
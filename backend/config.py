@@ -0,0 +1,34 @@
+import os
+
+# Settings can be overridden with environment variables of the same name
+
+# Model servers
+QWEN_SERVER_URL = os.environ.get("QWEN_SERVER_URL", "http://10.10.78.11:8080/v1/chat/completions")
+HUNYUAN_SERVER_URL = os.environ.get("HUNYUAN_SERVER_URL", "http://localhost:8081/generate")
+
+# Load the local models (Whisper, Stable Diffusion, BLIP) when the server starts instead of on first use
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS", "1") == "1"
+
+# Speech recognition: backend ("transformers", "int8" for dynamic int8 quantization on CPU,
+# "onnx" for ONNX Runtime on CPU), Whisper model and number of CPU threads (0 keeps the default)
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "transformers")
+ASR_MODEL = os.environ.get("ASR_MODEL", "openai/whisper-small")
+ASR_THREADS = int(os.environ.get("ASR_THREADS", "0"))
+# Directory where the ONNX export of the Whisper model is cached
+ASR_ONNX_DIR = os.environ.get("ASR_ONNX_DIR", "../onnx/whisper")
+
+# Reuse an asset with the same name from the library (recolored and scaled) instead of generating a new model
+ASSET_REUSE = os.environ.get("ASSET_REUSE", "1") == "1"
+
+# Compress GLB assets served by the backend (brotli if installed, otherwise gzip)
+ASSET_COMPRESSION = os.environ.get("ASSET_COMPRESSION", "1") == "1"
+
+# Admission control: utterances in flight from which the server skips task reviews, generates draft images,
+# only reuses existing assets, and rejects new utterances
+ADMISSION_DEPTHS = [int(depth) for depth in os.environ.get("ADMISSION_DEPTHS", "4,6,8,12").split(",")]
+# Latency target of an utterance in seconds, the server also degrades when the recent p95 exceeds it
+ADMISSION_LATENCY_TARGET = float(os.environ.get("ADMISSION_LATENCY_TARGET", "120"))
+
+# Record every session (audio, scene updates, LLM calls and stage timings) for offline replay
+CAPTURE_SESSIONS = os.environ.get("CAPTURE_SESSIONS", "0") == "1"
+CAPTURE_DIR = os.environ.get("CAPTURE_DIR", "../captures")
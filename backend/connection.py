@@ -0,0 +1,192 @@
+import asyncio
+import itertools
+import json
+
+from fastapi import WebSocketDisconnect
+
+from scene_sync import SceneGraph
+from spatial_resolver import resolve_position
+from tracing import span
+
+# User standing at the origin, used when there is no VR client
+HEADLESS_USER = {
+    "id": "user",
+    "name": "user",
+    "color": "none",
+    "position": {"x": 0, "y": 1.6, "z": 0},
+    "rotation": {"x": 0, "y": 0, "z": 0},
+}
+
+
+class ClientConnection:
+    """
+    Wraps a client WebSocket with a single reader that routes every incoming message:
+    - "environment_data" snapshots and "scene_delta" messages update the scene graph of the connection.
+    - Replies to server requests resolve the request waiting for them, matched by "request_id".
+    - Binary audio messages are queued as new utterances.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.scene_graph = SceneGraph()
+        self.snapshot_requested = False
+        self.utterances = asyncio.Queue()
+        self.pending = {}
+        self._request_ids = itertools.count(1)
+        # SessionLog receiving every client message when the session is captured
+        self.session_log = None
+
+    async def send(self, data):
+        """
+        Send a JSON message to the client.
+        Args:
+            data (dict): The message to send.
+        """
+        await self.websocket.send_text(json.dumps(data))
+
+    async def request(self, data, reply_type):
+        """
+        Send a JSON message to the client and wait for its reply.
+        Args:
+            data (dict): The message to send, a "request_id" is added to it.
+            reply_type (str): The type of the expected reply message.
+        Returns:
+            dict: The reply message.
+        """
+        request_id = f"req{next(self._request_ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (reply_type, future)
+        try:
+            # Time spent waiting for the client
+            with span(f"client.{reply_type}"):
+                await self.send({**data, "request_id": request_id})
+                return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _route(self, data):
+        message_type = data.get("type")
+        if message_type == "environment_data":
+            self.scene_graph.apply_snapshot(data.get("semanticGraph"), data.get("version", 0))
+            self.snapshot_requested = False
+            return
+        if message_type == "scene_delta":
+            applied = self.scene_graph.apply_delta(data.get("seq"), data.get("ops", []))
+            if not applied and not self.snapshot_requested:
+                # Out of sequence, ask once for a full snapshot and ignore deltas until it arrives
+                self.snapshot_requested = True
+                await self.send({
+                    "type": "request_snapshot",
+                    "version": self.scene_graph.version
+                })
+            return
+
+        # Reply to a pending request
+        request_id = data.get("request_id")
+        if request_id is not None:
+            reply_type, future = self.pending.get(request_id, (None, None))
+            if reply_type == message_type and not future.done():
+                future.set_result(data)
+            else:
+                # Late or duplicate reply, it must not answer another request
+                print(f"Dropping {message_type} reply to {request_id}: no such pending request")
+            return
+        # Clients that do not echo the request id answer the oldest request of that type
+        for reply_type, future in self.pending.values():
+            if reply_type == message_type and not future.done():
+                future.set_result(data)
+                return
+        print(f"Unexpected message received: {message_type}")
+
+    async def run(self):
+        """
+        Read messages until the client disconnects. Pending requests then fail with ConnectionError
+        and a None utterance is queued to signal the end of the connection.
+        """
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("text") is not None:
+                    try:
+                        data = json.loads(message["text"])
+                        if self.session_log is not None:
+                            if data.get("type") == "scene_delta":
+                                self.session_log.write_delta(data)
+                            else:
+                                self.session_log.write("client", message=data)
+                        await self._route(data)
+                    except Exception as e:
+                        print("Error parsing JSON:", e)
+                # Binary audio data
+                elif message.get("bytes") is not None:
+                    if self.session_log is not None:
+                        self.session_log.write_audio(message["bytes"])
+                    await self.utterances.put(message["bytes"])
+                else:
+                    print("Unknown message type received:", message)
+        except WebSocketDisconnect:
+            print("Client disconnected")
+        except Exception as e:
+            print(f"Error: {e}")
+        finally:
+            for _, future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Client disconnected"))
+            await self.utterances.put(None)
+
+
+class HeadlessConnection:
+    """
+    Stand-in for a client connection when the pipeline runs without a headset.
+    Server messages update the scene graph like the VR client does, and requests are answered locally:
+    - "calculate_position" places the object relative to its reference in the scene graph.
+    - "start_pointing_object" picks the first candidate.
+    - "start_pointing_location" answers a fixed location.
+    """
+
+    def __init__(self, models=(), pointing_location=(0.0, 0.5, -1.0)):
+        self.scene_graph = SceneGraph()
+        nodes = [{key: model.get(key) for key in ("id", "name", "color", "position")} for model in models]
+        self.scene_graph.apply_snapshot([HEADLESS_USER] + nodes)
+        self.pointing_location = pointing_location
+        self.sent = []
+
+    async def send(self, data):
+        """
+        Apply a message sent to the client to the scene graph.
+        Args:
+            data (dict): The message.
+        """
+        self.sent.append(data)
+        if data["type"] in ("new_model", "model_ready"):
+            model = data["model"]
+            node = {key: model.get(key) for key in ("id", "name", "color", "position")}
+            self.scene_graph.apply_delta(self.scene_graph.version + 1, [{"op": "update", "node": node}])
+        elif data["type"] == "delete_object":
+            self.scene_graph.apply_delta(self.scene_graph.version + 1, [{"op": "remove", "id": data["object_id"]}])
+
+    async def request(self, data, reply_type):
+        """
+        Answer a request the way a user would.
+        Args:
+            data (dict): The request message.
+            reply_type (str): The type of the expected reply message.
+        Returns:
+            dict: The reply message.
+        Raises:
+            ValueError: If the request cannot be answered, e.g. its reference object is not in the scene.
+        """
+        with span(f"client.{reply_type}"):
+            if reply_type == "world_position":
+                position = resolve_position(data["reference_id"], data["direction"], data["distance"], self.scene_graph.semantic_graph())
+                if position is None:
+                    raise ValueError(f"Cannot place an object {data['direction']} of {data['reference_id']}: not in the scene")
+                return {"type": reply_type, "position": position}
+            if reply_type == "pointing_object":
+                return {"type": reply_type, "object_id": data["disambiguation_candidates"][0]}
+            if reply_type == "pointing_location":
+                x, y, z = self.pointing_location
+                return {"type": reply_type, "position": {"x": x, "y": y, "z": z}}
+        raise ValueError(f"Unknown request: {reply_type}")
@@ -2,8 +2,15 @@ import base64
 import httpx
 import io
 import time
-from html_template import HTML_BASE
 from PIL import Image
+from config import HUNYUAN_SERVER_URL
+from tracing import traced
+
+# The HTML preview of each model is optional
+try:
+    from html_template import HTML_BASE
+except ImportError:
+    HTML_BASE = None
 
 # Convert PIL image to base64 string
 def pil_image_to_base64_str(img):
@@ -14,7 +21,7 @@ def pil_image_to_base64_str(img):
 # Send POST request with base64 image and get response
 async def send_3d_request(
     image_b64_str,
-    server_url="http://aicube_hunyuan:8081/generate",
+    server_url=HUNYUAN_SERVER_URL,
     generate_texture=True,
 ):
     """
@@ -38,6 +45,7 @@ async def send_3d_request(
         print(f"Request failed with status code {response.status_code}: {response.text}")
         return None
 
+@traced("generate_3D_model")
 async def generate_3D_model(image_path, object_id):
     """
     Generate a 3D model of the specified object using Stable Diffusion.
@@ -58,7 +66,7 @@ async def generate_3D_model(image_path, object_id):
         start_time = time.time()
         result = await send_3d_request(
             image_b64_str,
-            server_url="http://localhost:8081/generate",
+            server_url=HUNYUAN_SERVER_URL,
             generate_texture=True,
         )
         end_time = time.time()
@@ -76,14 +84,15 @@ async def generate_3D_model(image_path, object_id):
             f.write(result)
         print(f"3D model saved to {output_path}")
 
-        # Generate HTML content with embedded 3D model
-        glb_b64 = base64.b64encode(result).decode("utf-8")
-        html_content = HTML_BASE.format(MODEL_DATA=glb_b64)
+        if HTML_BASE is not None:
+            # Generate HTML content with embedded 3D model
+            glb_b64 = base64.b64encode(result).decode("utf-8")
+            html_content = HTML_BASE.format(MODEL_DATA=glb_b64)
 
-        # Save the HTML content to a file
-        html_file_path = f"../html/{object_id}.html"
-        with open(html_file_path, "w") as html_file:
-            html_file.write(html_content)
+            # Save the HTML content to a file
+            html_file_path = f"../html/{object_id}.html"
+            with open(html_file_path, "w") as html_file:
+                html_file.write(html_content)
 
         return f"../../models/{object_id}.glb".replace(" ", "_")
     else:
@@ -1,47 +1,50 @@
-import json
+import asyncio
 import time
-import torch
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.middleware.cors import CORSMiddleware
 
+from admission import Overloaded, admission
+from asset_library import load_asset_library
+from asset_server import router as asset_router, scene_manifest
+from color_extractor import load_color_extractor
+from config import CAPTURE_DIR, CAPTURE_SESSIONS, PRELOAD_MODELS
+from connection import ClientConnection
 from pipelines import handle_task, handle_disambiguation
+from scene_manager import SceneManager
+from session_log import audio_key, current_session_log, open_session_log
 from task_classifier import classify_task
-from whisper import transcribe_audio
+from text_to_image import load_sd_pipe
+from tracing import finish_trace, metrics, start_trace
+from whisper import load_whisper_pipe, transcribe_audio
 
 # Initialize FastAPI app
 app = FastAPI()
-
-device = "cuda" if torch.cuda.is_available() else "cpu"
-# Load Whisper model for audio transcription
-torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-whisper_model = AutoModelForSpeechSeq2Seq.from_pretrained(
-    "openai/whisper-small", # or "openai/whisper-large-v3" if you want to upgrade
-    torch_dtype=torch_dtype,
-    low_cpu_mem_usage=True,
-    use_safetensors=True,
-    cache_dir="/mnt/shared_models/huggingface/cache/hub"
-).to(device)
-whisper_processor = AutoProcessor.from_pretrained("openai/whisper-small", cache_dir="/mnt/shared_models/huggingface/cache/hub")
-# Create pipeline with chunk processing
-whisper_pipe = pipeline(
-    "automatic-speech-recognition",
-    model=whisper_model,
-    tokenizer=whisper_processor.tokenizer,
-    feature_extractor=whisper_processor.feature_extractor,
-    max_new_tokens=128,
-    chunk_length_s=5,  # Process in 5-second chunks
-    batch_size=16,
-    torch_dtype=torch_dtype,
-    device=device,
-    model_kwargs={
-        "cache_dir": "/mnt/shared_models/huggingface/cache/hub"
-    }
+# Assets are fetched by the frontend, which is served from another origin
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["GET"],
+    allow_headers=["Range", "If-None-Match", "If-Range"],
+    expose_headers=["ETag", "Content-Range", "Content-Length", "Content-Encoding"],
 )
+app.include_router(asset_router)
+# Scenes shared by the connections of this process
+scene_manager = SceneManager()
+
+
+# Load the local models and index the asset library before accepting connections
+@app.on_event("startup")
+async def load_models():
+    await asyncio.to_thread(load_asset_library)
+    if PRELOAD_MODELS:
+        await asyncio.to_thread(load_whisper_pipe)
+        await asyncio.to_thread(load_sd_pipe)
+        await asyncio.to_thread(load_color_extractor)
 
 
 # Main function - Workflow
-async def main(question, semantic_graph, nameCounters, websocket):
+async def main(question, semantic_graph, scene, connection):
     clarification = ""
 
     # Classify the user's question
@@ -49,7 +52,7 @@ async def main(question, semantic_graph, nameCounters, websocket):
 
     # Handle disambiguation if needed
     if response['requires_disambiguation'] or response['requires_pointing']:
-        clarification = await handle_disambiguation(response, websocket)
+        clarification = await handle_disambiguation(response, connection)
         response = await classify_task(question, semantic_graph, clarification)
     
     # If final position is provided from disambiguation, use it
@@ -63,63 +66,170 @@ async def main(question, semantic_graph, nameCounters, websocket):
         question = response['final_action']
     
     # Handle the main task
-    await handle_task(question, semantic_graph, nameCounters, final_position, websocket)
+    await handle_task(question, semantic_graph, scene, final_position, connection)
     return
 
 
+async def process_utterance(audio_data, scene, connection):
+    """
+    Transcribe an utterance and run the main workflow on it.
+    Args:
+        audio_data (bytes): Audio data in float32 format.
+        scene (Scene): The scene of the connection.
+        connection (ClientConnection): The connection to communicate with the client.
+    """
+    start_time = time.time()
+    trace = start_trace()
+
+    # Turn the utterance away straight away when the server is overloaded,
+    # otherwise its mode is decided here for all of its tasks
+    try:
+        admitted = admission.admit()
+    except Overloaded as e:
+        print(f"Utterance {trace.request_id} rejected: {e}")
+        await connection.send({
+            "type": "utterance_complete",
+            "request_id": trace.request_id,
+            "status": "rejected",
+            "retry_after": e.retry_after,
+            "message": str(e)
+        })
+        return
+
+    transcription, status, retry_after = None, "aborted", None
+    try:
+        # Transcribe audio to text without blocking the connection's reader,
+        # loading Whisper in the worker thread too when it was not preloaded
+        transcription = await asyncio.to_thread(lambda: transcribe_audio(audio_data, load_whisper_pipe()))
+        # Send transcription back
+        await connection.send({
+            "type": "transcription",
+            "transcription": transcription,
+            "request_id": trace.request_id
+        })
+
+        # Get the semantic graph kept in sync with the client, ids are allocated by the scene
+        semantic_graph = connection.scene_graph.semantic_graph()
+
+        # Process the transcription and initiate the main workflow
+        await main(transcription, semantic_graph, scene, connection)
+        status = "done"
+        if admitted["skipped"]:
+            # New models were needed while only existing assets could be used
+            status, retry_after = "partial", admission.retry_after()
+    except ConnectionError:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        status = "failed"
+    finally:
+        admission.release(time.perf_counter() - trace.start)
+        trace_data = finish_trace(trace)
+        # Stage timings of the utterance, for replays of captured sessions
+        session_log = current_session_log.get()
+        if session_log is not None:
+            session_log.write(
+                "utterance",
+                request_id=trace.request_id,
+                audio_key=audio_key(audio_data),
+                transcription=transcription,
+                status=status,
+                trace=trace_data
+            )
+
+    # Tell the client the utterance has been fully handled
+    message = {
+        "type": "utterance_complete",
+        "request_id": trace.request_id,
+        "status": status
+    }
+    if retry_after is not None:
+        message["skipped"] = admitted["skipped"]
+        message["retry_after"] = retry_after
+        message["message"] = f"The server is busy, {', '.join(admitted['skipped'])} could not be created. Please try again in {retry_after} seconds."
+    await connection.send(message)
+
+    end_time = time.time()
+    elapsed = end_time - start_time
+    minutes = int(elapsed // 60)
+    seconds = int(elapsed % 60)
+    print(f"Total time: {minutes} mins {seconds} secs.")
+
+
+async def run_utterance(audio_data, scene, connection):
+    try:
+        await process_utterance(audio_data, scene, connection)
+    except ConnectionError:
+        print("Utterance aborted: client disconnected")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+# Latency percentiles of every stage and the current admission mode
+@app.get("/metrics")
+async def metrics_endpoint():
+    return {"stages": metrics(), "admission": admission.status()}
+
+
+# Scene manifest
+@app.get("/scenes/{scene_id}/manifest")
+async def get_scene_manifest(scene_id: str):
+    """Records of a scene with the content-hash URLs of their assets, for the client to prefetch."""
+    try:
+        scene = scene_manager.open(scene_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Scene not found")
+    try:
+        manifest = await asyncio.to_thread(scene_manifest, list(scene.models))
+    finally:
+        scene_manager.close(scene)
+    return {"scene": scene.scene_id, **manifest}
+
+
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    latest_environment_data = {}
-    
+    connection = ClientConnection(websocket)
+
+    # Each connection works on its own scene, selected with the "scene" query parameter
+    try:
+        scene = scene_manager.open(websocket.query_params.get("scene"))
+    except ValueError as e:
+        print(f"Error: {e}")
+        await websocket.close(code=1008)
+        return
+    await connection.send({
+        "type": "session",
+        "scene_id": scene.scene_id
+    })
+
+    # Captured sessions log everything needed to replay them offline, utterance tasks inherit the log
+    session_log = None
+    if CAPTURE_SESSIONS:
+        session_log = open_session_log(CAPTURE_DIR, scene, load_asset_library().snapshot())
+        connection.session_log = session_log
+        current_session_log.set(session_log)
+
+    # A single reader routes client messages, so new utterances are accepted while others are in flight
+    reader = asyncio.create_task(connection.run())
+    utterance_tasks = set()
     while True:
-        try:
-            message = await websocket.receive()
-            if 'text' in message:
-                try:
-                    data = json.loads(message['text'])
-                    # Update latest environment data if received
-                    if data.get("type") == "environment_data":
-                        latest_environment_data = data
-                    else:
-                        print("Unknown text message received.")
-                except Exception as e:
-                    print("Error parsing JSON:", e)
-
-            # Binary audio data
-            elif 'bytes' in message:
-                start_time = time.time()
-                audio_data = message['bytes']
-
-                # Transcribe audio to text
-                transcription = transcribe_audio(audio_data, whisper_pipe)
-                # Send transcription back
-                await websocket.send_text(json.dumps({
-                    "type": "transcription",
-                    "transcription": transcription
-                }))
-
-                # Get semantic graph and name counters from latest environment data
-                semantic_graph = latest_environment_data.get("semanticGraph")
-                nameCounters = latest_environment_data.get("nameCounters")
-                
-                # Process the transcription and initiate the main workflow
-                await main(transcription, semantic_graph, nameCounters, websocket)
-                
-                end_time = time.time()
-                elapsed = end_time - start_time
-                minutes = int(elapsed // 60)
-                seconds = int(elapsed % 60)
-                print(f"Total time: {minutes} mins {seconds} secs.")
-            else: 
-                print("Unknown message type received:", message)
-
-        except WebSocketDisconnect:
-            print("Client disconnected")
-        except Exception as e:
-            print(f"Error: {e}")
+        audio_data = await connection.utterances.get()
+        if audio_data is None:
             break
+        task = asyncio.create_task(run_utterance(audio_data, scene, connection))
+        utterance_tasks.add(task)
+        task.add_done_callback(utterance_tasks.discard)
+
+    # Client disconnected, stop the work still in flight
+    for task in utterance_tasks:
+        task.cancel()
+    await asyncio.gather(*utterance_tasks, return_exceptions=True)
+    await reader
+    scene_manager.close(scene)
+    if session_log is not None:
+        session_log.close()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, ws_ping_interval=1200, ws_ping_timeout=60)
\ No newline at end of file
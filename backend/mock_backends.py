@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+import trimesh
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from PIL import Image, ImageColor
+
+from session_log import audio_key
+from tracing import traced
+
+# Deterministic stand-ins for the models used by the backend, with configurable latencies (in seconds).
+# Whisper, Stable Diffusion and BLIP are replaced in-process, Qwen and Hunyuan3D by local HTTP servers.
+DEFAULT_LATENCIES = {
+    "asr": 0.3,
+    "qwen": 0.5,
+    "sd": 2.0,
+    "hunyuan": 5.0,
+    "blip": 0.2,
+}
+SAMPLE_RATE = 16000
+# Latency of a draft image relative to a default one (20 of the 50 default steps)
+DRAFT_LATENCY_RATIO = 0.4
+DEFAULT_TRANSCRIPTION = "Create a box in front of me"
+
+COMMAND_VERBS = {"create", "add", "make", "place", "put", "generate", "move", "remove", "delete", "build"}
+ARTICLES = {"a", "an", "the", "one", "1", "some", "new"}
+SPATIAL_MARKERS = [" in front", " next to", " on top", " on ", " under", " behind", " to the", " to my", " over ", " here", " there", " at "]
+DIRECTION_WORDS = [
+    ("in front", "front"), ("behind", "back"), ("left", "left"), ("right", "right"),
+    ("next to", "right"), ("on top", "up"), (" on ", "up"), ("under", "down"),
+]
+
+# Transcription of every registered utterance, by hash of its audio
+transcripts = {}
+
+
+def encode_utterance(text, seconds_per_word=0.4):
+    """
+    Build deterministic float32 audio for a text command, registered so the Whisper stand-in transcribes it back.
+    Args:
+        text (str): The command.
+        seconds_per_word (float): Duration of the audio per word of the command.
+    Returns:
+        bytes: The audio data in float32 format.
+    """
+    seed = int(hashlib.sha1(text.encode()).hexdigest()[:8], 16)
+    samples = int(SAMPLE_RATE * seconds_per_word * max(len(text.split()), 1))
+    audio = (np.random.default_rng(seed).standard_normal(samples) * 0.01).astype(np.float32)
+    audio_data = audio.tobytes()
+    register_utterance(audio_data, text)
+    return audio_data
+
+
+def register_utterance(audio_data, text):
+    """
+    Register the transcription of recorded audio for the Whisper stand-in.
+    Args:
+        audio_data (bytes): The audio data in float32 format.
+        text (str): Its transcription.
+    """
+    transcripts[audio_key(audio_data)] = text
+
+
+# Local models
+
+def make_transcribe_audio(latency):
+    @traced("transcribe_audio")
+    def transcribe_audio(audio_data, pipe=None):
+        time.sleep(latency)
+        transcription = transcripts.get(audio_key(audio_data), DEFAULT_TRANSCRIPTION)
+        print("Transcription:", transcription)
+        return transcription
+    return transcribe_audio
+
+
+def make_generate_image(latency):
+    # Stable Diffusion runs one image at a time on the GPU
+    sd_lock = threading.Lock()
+
+    @traced("generate_image")
+    def generate_image(object_name, object_id, profile="default"):
+        with sd_lock:
+            # Draft images use fewer denoising steps at a lower resolution
+            time.sleep(latency * DRAFT_LATENCY_RATIO if profile == "draft" else latency)
+        seed = hashlib.sha1(object_name.encode()).digest()
+        image = Image.new("RGB", (64, 64), tuple(seed[:3]))
+        image_path = f"../images/{object_id}.png".replace(" ", "_")
+        image.save(image_path)
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG")
+        return list(buffered.getvalue()), image_path
+    return generate_image
+
+
+def make_color_extractor(latency):
+    @traced("color_extractor")
+    def color_extractor(image_path, object_name):
+        time.sleep(latency)
+        # Answer with the first color named in the description
+        for word in object_name.lower().split():
+            if word in ImageColor.colormap:
+                return word
+        return "white"
+    return color_extractor
+
+
+def install(latencies):
+    """
+    Replace Whisper, Stable Diffusion and BLIP in the backend modules with their stand-ins.
+    Args:
+        latencies (dict): Latency of each stand-in, keyed like DEFAULT_LATENCIES.
+    """
+    import main
+    import pipelines
+
+    main.load_whisper_pipe = lambda: None
+    main.transcribe_audio = make_transcribe_audio(latencies["asr"])
+    pipelines.generate_image = make_generate_image(latencies["sd"])
+    pipelines.color_extractor = make_color_extractor(latencies["blip"])
+
+
+# Qwen server
+
+def strip_command(text):
+    """Turn a command into the description of its object, e.g. "Create a red chair here" -> "red chair"."""
+    text = f" {text.lower().strip(' .!?')} "
+    cut = min((text.find(marker) for marker in SPATIAL_MARKERS if text.find(marker) > 0), default=len(text))
+    words = [word for word in text[:cut].split() if word not in COMMAND_VERBS and word not in ARTICLES]
+    return " ".join(words) or "box"
+
+
+def scene_nodes(prompt):
+    return re.findall(r"'id': '([^']+)', 'name': '([^']+)'", prompt)
+
+
+def mock_classification(prompt):
+    task = re.search(r'Task: "(.*)"', prompt).group(1)
+    clarification = re.search(r"Clarification: (.*)", prompt).group(1).strip()
+    lowered = task.lower()
+    response = {
+        "manipulate_objects": [],
+        "delete_objects": [],
+        "classification": "create",
+        "requires_disambiguation": False,
+        "disambiguation_candidates": [],
+        "disambiguation_phrases": [],
+        "requires_pointing": False,
+        "spatial_phrases": [],
+        "final_action": "",
+        "final_position": "",
+    }
+    mentioned = [object_id for object_id, name in scene_nodes(prompt) if name != "user" and name in lowered]
+    first_word = lowered.split()[0] if lowered.split() else ""
+
+    if " and " in lowered:
+        response["classification"] = "multitask"
+    elif first_word in ("remove", "delete"):
+        response["classification"] = "delete"
+        response["delete_objects"] = mentioned[:1]
+    elif first_word in ("move", "put", "place") and mentioned:
+        response["classification"] = "manipulate"
+        response["manipulate_objects"] = mentioned[:1]
+
+    # Vague locations need pointing, resolved once the client answered
+    spatial_phrase = next((phrase for phrase in ("here", "there") if re.search(rf"\b{phrase}\b", lowered)), None)
+    if spatial_phrase and "location:" not in clarification:
+        response["requires_pointing"] = True
+        response["spatial_phrases"] = [spatial_phrase]
+    elif spatial_phrase:
+        numbers = re.findall(r"-?\d+(?:\.\d+)?", clarification.split("location:")[-1])
+        if len(numbers) >= 3:
+            response["final_position"] = " ".join(numbers[:3])
+            response["final_action"] = re.sub(rf"\b{spatial_phrase}\b", response["final_position"], task)
+    return response
+
+
+def mock_position(prompt):
+    question = re.search(r"Question: (.*)", prompt).group(1).lower()
+    direction = next((direction for word, direction in DIRECTION_WORDS if word in f" {question} "), "front")
+    graph_line = re.search(r"Semantic Graph: (.*)", prompt).group(1)
+    reference_id = "user"
+    for object_id, name in scene_nodes(graph_line):
+        if name != "user" and f"the {name}" in question:
+            reference_id = object_id
+    distance = 0.5 if direction in ("up", "down") else 1
+    return {"reference_id": reference_id, "direction": direction, "distance": distance}
+
+
+def mock_qwen_response(messages):
+    """
+    Deterministic answer to each of the prompts sent by the backend, recognized by their system message.
+    Args:
+        messages (list): The chat completion messages.
+    Returns:
+        str: The answer.
+    """
+    system, prompt = messages[0]["content"], messages[-1]["content"]
+    if "classify tasks" in system:
+        return json.dumps(mock_classification(prompt))
+    if "break down complex questions" in system:
+        question = prompt.rsplit("The user's question is:", 1)[-1].strip()
+        return "[" + ", ".join(part.strip() for part in re.split(r"\s+and\s+", question)) + "]"
+    if "review tasks" in system:
+        return "positive"
+    if "extract the object they need to create" in system:
+        return strip_command(re.search(r"Query: (.*)", prompt).group(1))
+    if "extract the name of the main object" in system:
+        return strip_command(re.search(r"User's request: (.*)", prompt).group(1)).split()[-1]
+    if "spatial directions" in system:
+        return json.dumps(mock_position(prompt))
+    return ""
+
+
+def create_qwen_app(latency):
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        return {"choices": [{"message": {"role": "assistant", "content": mock_qwen_response(payload["messages"])}}]}
+
+    return app
+
+
+# Hunyuan3D server
+
+def create_hunyuan_app(latency):
+    app = FastAPI()
+    # Hunyuan3D generates one model at a time on the GPU
+    gpu_lock = asyncio.Lock()
+    model_bytes = trimesh.creation.box(extents=(0.5, 0.5, 0.5)).export(file_type="glb")
+
+    @app.post("/generate")
+    async def generate(request: Request):
+        await request.json()
+        async with gpu_lock:
+            await asyncio.sleep(latency)
+        return Response(content=model_bytes, media_type="model/gltf-binary")
+
+    return app
+
+
+def start_server(app, port):
+    """
+    Run an HTTP app on a local port in a background thread with its own event loop.
+    Args:
+        app (FastAPI): The app to serve.
+        port (int): The local port.
+    Returns:
+        uvicorn.Server: The running server, stopped by setting should_exit.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def start_backend(app, port):
+    """
+    Run the backend under test on a local port in the current event loop.
+    Args:
+        app (FastAPI): The backend app.
+        port (int): The local port.
+    Returns:
+        tuple: The running uvicorn.Server, stopped by setting should_exit, and the task serving it.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def create_work_dir(prefix):
+    """
+    Create a temporary copy of the project layout and move to its backend directory, so the generated
+    images, models, scenes and traces don't touch the project. The backend modules must be imported after.
+    Args:
+        prefix (str): Prefix of the temporary directory.
+    Returns:
+        str: The temporary project, removed by the caller.
+    """
+    work_dir = tempfile.mkdtemp(prefix=prefix)
+    for directory in ("backend", "images", "models", "data", "traces"):
+        os.makedirs(os.path.join(work_dir, directory))
+    os.chdir(os.path.join(work_dir, "backend"))
+    return work_dir
+
+
+def start_mock_servers(latencies, qwen_port, hunyuan_port):
+    """
+    Start the Qwen and Hunyuan3D stand-in servers.
+    Args:
+        latencies (dict): Latency of each stand-in, keyed like DEFAULT_LATENCIES.
+        qwen_port (int): Local port of the Qwen stand-in.
+        hunyuan_port (int): Local port of the Hunyuan3D stand-in.
+    Returns:
+        list: The running servers.
+    """
+    return [
+        start_server(create_qwen_app(latencies["qwen"]), qwen_port),
+        start_server(create_hunyuan_app(latencies["hunyuan"]), hunyuan_port),
+    ]
@@ -0,0 +1,234 @@
+import argparse
+import glob
+import io
+import json
+import os
+
+import fast_simplification
+import numpy as np
+import trimesh
+from PIL import Image
+
+from tracing import traced
+
+# LOD levels: fraction of faces kept and maximum texture size for each variant
+LOD_LEVELS = [
+    {"face_ratio": 0.5, "max_texture_size": 1024},
+    {"face_ratio": 0.15, "max_texture_size": 512},
+]
+# Number of bits used to quantize vertex positions and texture coordinates
+POSITION_BITS = 14
+TEXCOORD_BITS = 12
+# JPEG quality for textures without transparency
+JPEG_QUALITY = 85
+# A face spanning more than this fraction of the texture atlas crosses a UV seam (coarse faces legitimately span ~0.1)
+UV_SPAN_LIMIT = 0.3
+# Extra fraction of such faces tolerated in a LOD before its decimation is dropped
+UV_SPAN_TOLERANCE = 0.01
+
+
+def quantize(values, bits, low=None, high=None):
+    """
+    Snap values onto a uniform grid of 2^bits steps between low and high.
+    Args:
+        values (np.ndarray): Array of values (N x D).
+        bits (int): Number of bits of the quantization grid.
+        low (np.ndarray or None): Lower bound of the grid (defaults to the minimum of values).
+        high (np.ndarray or None): Upper bound of the grid (defaults to the maximum of values).
+    Returns:
+        np.ndarray: The quantized values.
+    """
+    low = values.min(axis=0) if low is None else low
+    high = values.max(axis=0) if high is None else high
+    step = (high - low) / float(2 ** bits - 1)
+    step[step == 0] = 1.0
+    return np.round((values - low) / step) * step + low
+
+
+def compress_texture(image, max_size):
+    """
+    Downscale a texture and re-encode it as JPEG when it has no transparency.
+    Args:
+        image (PIL.Image): The texture image.
+        max_size (int): Maximum width/height of the texture.
+    Returns:
+        PIL.Image: The compressed texture.
+    """
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    has_alpha = image.mode in ("RGBA", "LA") and image.getextrema()[-1][0] < 255
+    buffered = io.BytesIO()
+    if has_alpha:
+        image.save(buffered, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(buffered, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    buffered.seek(0)
+    # Re-open so the exporter keeps the compressed encoding
+    return Image.open(buffered)
+
+
+def decimate(mesh, face_count, preserve_border):
+    """
+    Decimate a mesh and find, for every remaining vertex, the original vertex its attributes are taken from.
+    Args:
+        mesh (trimesh.Trimesh): The original mesh.
+        face_count (int): Target number of faces.
+        preserve_border (bool): Keep the vertices on open borders (UV seams of a textured mesh) in place.
+    Returns:
+        np.ndarray: Vertices of the decimated mesh.
+        np.ndarray: Faces of the decimated mesh.
+        np.ndarray: Index of the source original vertex of each decimated vertex.
+    """
+    vertices, faces, collapses = fast_simplification.simplify(
+        mesh.vertices, mesh.faces, target_count=face_count, preserve_border=preserve_border, return_collapses=True)
+    _, _, mapping = fast_simplification.replay_simplification(mesh.vertices, mesh.faces, collapses)
+
+    # Vertices only collapse along edges, so the vertices merged into one come from the same UV chart.
+    # The one closest to the new position is the source of its attributes.
+    referenced = np.flatnonzero(mapping >= 0)
+    distance = np.linalg.norm(mesh.vertices[referenced] - vertices[mapping[referenced]], axis=1)
+    order = referenced[np.lexsort((distance, mapping[referenced]))]
+    _, first = np.unique(mapping[order], return_index=True)
+    return vertices, faces, order[first]
+
+
+def uv_span_ratio(uv, faces):
+    """
+    Fraction of faces whose texture coordinates span more than UV_SPAN_LIMIT of the atlas,
+    which is where a decimation stretches faces across UV seams.
+    Args:
+        uv (np.ndarray): Texture coordinates of the vertices.
+        faces (np.ndarray): Faces of the mesh.
+    Returns:
+        float: The fraction of faces.
+    """
+    if len(faces) == 0:
+        return 0.0
+    face_uv = uv[faces]
+    return float(((face_uv.max(axis=1) - face_uv.min(axis=1)).max(axis=1) > UV_SPAN_LIMIT).mean())
+
+
+def simplify_mesh(mesh, face_ratio, max_texture_size):
+    """
+    Build a decimated, quantized copy of a mesh with a downscaled texture.
+    Textured meshes keep their UV seams in place, so LODs of meshes with many seams keep more faces than face_ratio.
+    Args:
+        mesh (trimesh.Trimesh): The original mesh.
+        face_ratio (float): Fraction of faces to keep.
+        max_texture_size (int): Maximum width/height of the texture.
+    Returns:
+        trimesh.Trimesh: The simplified mesh.
+    """
+    visual = mesh.visual
+    textured = isinstance(visual, trimesh.visual.TextureVisuals) and visual.uv is not None
+    face_count = max(int(len(mesh.faces) * face_ratio), 4)
+    if face_count < len(mesh.faces):
+        # UV seams split the vertices of a textured mesh, so they are open borders for the decimation
+        vertices, faces, source = decimate(mesh, face_count, preserve_border=textured)
+    else:
+        vertices, faces, source = mesh.vertices, mesh.faces, np.arange(len(mesh.vertices))
+
+    if textured:
+        uv = visual.uv[source]
+        if uv_span_ratio(uv, faces) > uv_span_ratio(visual.uv, mesh.faces) + UV_SPAN_TOLERANCE:
+            # The decimation still broke the texture layout, only the texture and precision are reduced
+            print(f"Decimation stretches the texture of a {len(mesh.faces)}-face mesh, keeping all its faces")
+            vertices, faces, uv = mesh.vertices, mesh.faces, visual.uv
+        uv = quantize(uv, TEXCOORD_BITS, np.zeros(2), np.ones(2))
+        material = visual.material.copy()
+        if getattr(material, "baseColorTexture", None) is not None:
+            material.baseColorTexture = compress_texture(material.baseColorTexture, max_texture_size)
+        elif getattr(material, "image", None) is not None:
+            material.image = compress_texture(material.image, max_texture_size)
+        new_visual = trimesh.visual.TextureVisuals(uv=uv, material=material)
+    elif isinstance(visual, trimesh.visual.ColorVisuals) and visual.kind == "vertex":
+        new_visual = trimesh.visual.ColorVisuals(vertex_colors=visual.vertex_colors[source])
+    else:
+        new_visual = None
+
+    vertices = quantize(vertices, POSITION_BITS, *mesh.bounds)
+    result = trimesh.Trimesh(vertices=vertices, faces=faces, visual=new_visual, process=False)
+    # Vertices that collapsed onto the same grid point (with the same texture coordinates) are merged
+    result.merge_vertices()
+    return result
+
+
+@traced("generate_lods")
+def generate_lods(input_path, output_dir="../models/lod"):
+    """
+    Generate LOD variants of a GLB model, keeping the original untouched.
+    Args:
+        input_path (str): Path to the original .glb file.
+        output_dir (str): Directory where the LOD variants are saved.
+    Returns:
+        list: Paths of the generated LOD files, from highest to lowest detail.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    scene = trimesh.load(input_path, force="scene")
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+
+    lod_paths = []
+    for level, lod in enumerate(LOD_LEVELS, start=1):
+        lod_scene = scene.copy()
+        for geometry_name, mesh in scene.geometry.items():
+            if isinstance(mesh, trimesh.Trimesh) and len(mesh.faces) > 0:
+                lod_scene.geometry[geometry_name] = simplify_mesh(mesh, lod["face_ratio"], lod["max_texture_size"])
+        output_path = os.path.join(output_dir, f"{stem}_lod{level}.glb")
+        # Written to a temporary file first, so a client never downloads a partly written LOD
+        lod_scene.export(f"{output_path}.tmp", file_type="glb")
+        os.replace(f"{output_path}.tmp", output_path)
+        lod_paths.append(output_path)
+    return lod_paths
+
+
+def process_directory(models_dir="../models", models_file="../data/models.json"):
+    """
+    Re-process every .glb model in a directory and report the size reduction.
+    Args:
+        models_dir (str): Directory containing the original .glb models.
+        models_file (str): Scene file whose records are updated with the LOD paths.
+    """
+    lods_by_path = {}
+    total_original, total_lods = 0, [0] * len(LOD_LEVELS)
+    for model_path in sorted(glob.glob(os.path.join(models_dir, "*.glb"))):
+        try:
+            lod_paths = generate_lods(model_path, os.path.join(models_dir, "lod"))
+        except Exception as e:
+            print(f"Error processing {model_path}: {e}")
+            continue
+
+        original_size = os.path.getsize(model_path)
+        lod_sizes = [os.path.getsize(path) for path in lod_paths]
+        total_original += original_size
+        for level, size in enumerate(lod_sizes):
+            total_lods[level] += size
+        reductions = ", ".join(f"lod{level}: {size / 1024:.0f} KB (-{100 * (1 - size / original_size):.0f}%)"
+                               for level, size in enumerate(lod_sizes, start=1))
+        print(f"{os.path.basename(model_path)}: {original_size / 1024:.0f} KB -> {reductions}")
+
+        # Paths as seen by the frontend
+        lods_by_path[f"../{model_path}"] = [f"../{path}" for path in lod_paths]
+
+    if total_original:
+        reductions = ", ".join(f"lod{level}: {size / 2**20:.1f} MB (-{100 * (1 - size / total_original):.0f}%)"
+                               for level, size in enumerate(total_lods, start=1))
+        print(f"Total: {total_original / 2**20:.1f} MB -> {reductions}")
+
+    # Attach the LOD paths to the existing scene records
+    if os.path.exists(models_file):
+        with open(models_file, "r") as f:
+            models = json.load(f)
+        for model in models:
+            if model.get("path") in lods_by_path:
+                model["lods"] = lods_by_path[model["path"]]
+        with open(models_file, "w") as f:
+            json.dump(models, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate LOD variants for the existing .glb models.")
+    parser.add_argument("--models-dir", default="../models", help="Directory containing the .glb models.")
+    parser.add_argument("--models-file", default="../data/models.json", help="Scene file to update with the LOD paths.")
+    args = parser.parse_args()
+    process_directory(args.models_dir, args.models_file)
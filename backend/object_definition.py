@@ -25,30 +25,12 @@ async def describe_object(task):
         {"role": "system", "content": "You are an AI assistant designed to help users extract the object they need to create in a VR environment."},
         {"role": "user", "content": prompt}
     ]
-    object = await qwen_model(messages)
+    object = await qwen_model(messages, stage="describe_object")
     if not object:
         return "unknown object"
     return object.strip()
 
 
-def generateId(name, nameCounters):
-    """
-    Generate a unique ID for an object based on its name and a counter.
-    Args:
-        name (str): The base name of the object.
-        nameCounters (dict): A dictionary tracking the count of each object name.
-    Returns:
-        str: A unique ID for the object.
-        dict: Updated nameCounters dictionary.
-    """
-    # If the name is not in the counters, initialize it
-    if name not in nameCounters:
-        nameCounters[name] = 1
-    else: # Otherwise, increment the counter
-        nameCounters[name] += 1
-    return f"{name}{nameCounters[name]}", nameCounters
-
-
 async def extract_name(task):
     """
     Extract the main object's name from the user's task.
@@ -74,7 +56,7 @@ async def extract_name(task):
         {"role": "system", "content": "You are an AI assistant designed to help users extract the name of the main object based on their request."},
         {"role": "user", "content": prompt}
     ]
-    name = await qwen_model(messages)
+    name = await qwen_model(messages, stage="extract_name")
     return name.strip().replace(" ", "_").lower()
 
 
@@ -146,11 +128,11 @@ async def define_position(question, semantic_graph):
         {"role": "system", "content": "You determine spatial directions from natural language instructions."},
         {"role": "user", "content": prompt}
     ]
-    result = await qwen_model(messages)
+    result = await qwen_model(messages, stage="define_position")
     return result.strip()
 
 
-async def define_object(object_id, name, properties, path, position):
+async def define_object(object_id, name, properties, path, position, status="ready", lods=None):
     """
     Define the properties of an object to be created in the VR environment.
     Args:
@@ -159,6 +141,8 @@ async def define_object(object_id, name, properties, path, position):
         properties (dict): A dictionary of properties containing the object's color.
         path (str): The file path to the object's 3D model.
         position (dict): A dictionary containing position details like reference_id, direction, and distance.
+        status (str): Generation status of the object ("pending" while it is generated, then "ready").
+        lods (list or None): File paths to the lower detail variants of the 3D model, from highest to lowest detail.
     Returns:
         dict: A dictionary containing all the object's properties.
     """
@@ -167,6 +151,8 @@ async def define_object(object_id, name, properties, path, position):
         "name": name,
         "color": properties.get("color", "unknown"),
         "path": path,
-        "position": position
+        "lods": lods or [],
+        "position": position,
+        "status": status
     }
     return object_properties
\ No newline at end of file
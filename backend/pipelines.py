@@ -1,101 +1,226 @@
+import asyncio
 import json
-import os
 
+from admission import admission
+from asset_library import create_variant, load_asset_library
 from color_extractor import color_extractor
+from config import ASSET_REUSE
 from image_to_3D import generate_3D_model
+from model_optimizer import generate_lods
+from spatial_resolver import resolve_position
 from task_classifier import classify_task
 from task_divider import divide_tasks, reviewer_tasks
 from text_to_image import generate_image
-from object_definition import define_object, define_position, extract_name, generateId, describe_object
+from object_definition import define_object, define_position, extract_name, describe_object
 
 
-async def create_object_pipeline(question, semantic_graph, nameCounters, final_position, websocket):
+async def create_object_pipeline(question, semantic_graph, scene, final_position, connection):
     """
     Create a new 3D object based on the user's question and place it in the environment.
     Args:
         question (str): The user's question or command.
         semantic_graph (dict): The current semantic graph of the environment.
-        nameCounters (dict): A dictionary to keep track of object name counts for unique ID generation.
+        scene (Scene): The scene of the connection, used for storage and unique ID generation.
         final_position (dict or None): The final position for the object if already determined.
-        websocket (WebSocket): The WebSocket connection to communicate with the client.
+        connection (ClientConnection): The connection to communicate with the client.
     Returns:
-        dict: The properties of the created object.
+        dict or None: The properties of the created object, or None if it was skipped in cache_only mode
+            or its generation failed.
     """
     # Describe the object based on the question
     object_description = await describe_object(question)
     # print(f"Object Description: {object_description}")
     
-    # Extract the object's name and generate its object_id
+    # Extract the object's name and allocate its object_id
     name = await extract_name(question)
-    object_id, nameCounters = generateId(name, nameCounters)
 
-    # Generate a stylized 3D render image of the object
-    image_bytes, image_path = generate_image(object_description, object_id)
+    # Look for an asset with the same name in the library, the only source of models when the server is overloaded
+    cache_only = admission.degraded("cache_only")
+    asset = load_asset_library().find(name) if ASSET_REUSE or cache_only else None
+    if asset is None and cache_only:
+        # Left out without touching the scene, the other tasks of the request still run
+        admission.skip(name)
+        return None
+    object_id = scene.allocate_id(name)
 
-    # Generate a 3D model of the object from the image
-    model_path = await generate_3D_model(image_path, object_id)
-    
-    # Extract the color of the object from the image
-    color = color_extractor(image_path, object_description)
-    properties = {"color": color}
-    # print(f"Object Color: {color}")
-    
-    # Determine the position of the object
+    # Determine the position of the object before generation, so a placeholder can be shown there
     if final_position == None:
         position_result = await define_position(question, semantic_graph)
         print("Position result: ", position_result)
 
-        # Request the client to calculate the world position
-        position_data = json.loads(position_result)
-        reference_id = position_data['reference_id']
-        direction = position_data['direction']
-        distance = position_data['distance']
-        await websocket.send_text(json.dumps({
-            "type": "calculate_position",
-            "reference_id": reference_id,
-            "direction": direction,
-            "distance": distance
-        }))
-        while True:
-            message = await websocket.receive()
-            if 'text' in message:
-                data = json.loads(message['text'])
-                if data.get("type") == "world_position":
-                    final_position = data.get("position")
-                    print(f"Calculated Position: {final_position}")
-                    break
+        # Calculate the world position
+        final_position = await calculate_position(position_result, semantic_graph, scene, connection)
+
+    # Send a lightweight placeholder to the client straight away
+    placeholder = await define_object(object_id, name, {}, None, final_position, status="pending")
+    placeholder["placeholder"] = {"type": "box"}
+    await scene.add_model(placeholder)
+    await connection.send({
+        "type": "new_model",
+        "model": placeholder
+    })
+
+    model_path, color, lod_paths = None, None, []
+    try:
+        # Reuse the matching asset, only generating a new model when there is none
+        if asset:
+            await send_progress(connection, object_id, "reusing_asset")
+            try:
+                model_path, color, lod_paths = await asyncio.to_thread(create_variant, asset, object_description, name, scene.asset_name(object_id))
+            except Exception as e:
+                print(f"Error occurred while reusing {asset['path']}: {e}")
+
+        if model_path is None and cache_only:
+            # Only existing assets are used in this mode, the object is left out instead of generated
+            admission.skip(name)
+        elif model_path is None:
+            asset = None
+            try:
+                # Generate a stylized 3D render image of the object
+                await send_progress(connection, object_id, "generating_image")
+                profile = "draft" if admission.degraded("draft") else "default"
+                image_bytes, image_path = await asyncio.to_thread(generate_image, object_description, scene.asset_name(object_id), profile)
+
+                # Swap the placeholder for a billboard of the generated image
+                placeholder["placeholder"] = {"type": "image", "src": f"../{image_path}"}
+                if await scene.update_model(placeholder) is None:
+                    # Deleted while its image was generated, no need to generate its model
+                    return None
+                await send_progress(connection, object_id, "generating_model", placeholder["placeholder"])
+
+                # Generate a 3D model of the object from the image
+                model_path = await generate_3D_model(image_path, scene.asset_name(object_id))
+            except Exception as e:
+                print(f"Error occurred while generating {object_id}: {e}")
+                model_path = None
+
+            # Extract the color of the object from the image, the model is kept without it if this fails
+            if model_path:
+                await send_progress(connection, object_id, "extracting_color")
+                try:
+                    color = await asyncio.to_thread(color_extractor, image_path, object_description)
+                except Exception as e:
+                    print(f"Error occurred while extracting the color of {object_id}: {e}")
+
+        # Generate lighter LOD variants of the model for VR delivery
+        if model_path and not lod_paths:
+            await send_progress(connection, object_id, "optimizing_model")
+            try:
+                lod_files = await asyncio.to_thread(generate_lods, model_path.replace("../../", "../", 1))
+                lod_paths = [f"../{path}" for path in lod_files]
+            except Exception as e:
+                print(f"Error occurred while generating LODs: {e}")
+    except asyncio.CancelledError:
+        # The client left mid-create, the placeholder must not stay pending in the scene
+        await scene.delete_model(object_id)
+        raise
+
+    if model_path is None:
+        # Nothing to show, the placeholder is removed instead of staying pending
+        await scene.delete_model(object_id)
+        await connection.send({
+            "type": "delete_object",
+            "object_id": object_id
+        })
+        return None
+
+    # New models become reusable assets, except drafts generated under load
+    if asset is None:
+        if not admission.degraded("draft"):
+            load_asset_library().add(name, color, model_path, lod_paths)
+    elif model_path == asset["path"] and lod_paths != asset["lods"]:
+        # LODs generated for a reused asset are kept with it instead of being generated on every reuse
+        load_asset_library().set_lods(model_path, lod_paths)
+
+    properties = {"color": color}
+    # print(f"Object Color: {color}")
 
     # Define the object with all its properties
-    object_properties = await define_object(object_id, name, properties, model_path, final_position)
+    object_properties = await define_object(object_id, name, properties, model_path, final_position, lods=lod_paths)
+    if asset:
+        # Keep track of the asset the model was derived from
+        object_properties["source"] = asset["path"]
+    elif admission.degraded("draft"):
+        # Not indexed as an asset when the library is rebuilt either
+        object_properties["draft"] = True
     
-    # Save the new model to the models.json file
-    await save_model(object_properties)
-    # Send the new model data to the client
-    await websocket.send_text(json.dumps({
-        "type": "new_model",
+    # Save the final model in the scene, unless it was deleted meanwhile (at the position it was moved to, if any)
+    object_properties = await scene.update_model(object_properties)
+    if object_properties is None:
+        return None
+    # Tell the client to swap the placeholder for the final model
+    await connection.send({
+        "type": "model_ready",
         "model": object_properties
-    }))
+    })
     return object_properties
 
 
-async def manipulate_object_pipeline(question, semantic_graph, object_id, final_position, websocket):
+async def calculate_position(position_result, semantic_graph, scene, connection, exclude_id=None):
+    """
+    Calculate the world position of a relative placement on the server, avoiding other objects.
+    The client is only asked to calculate it when the reference is not in the semantic graph.
+    Args:
+        position_result (str): JSON string with the reference ID, direction and distance.
+        semantic_graph (dict): The current semantic graph of the environment.
+        scene (Scene): The scene of the connection, whose stored objects are also avoided.
+        connection (ClientConnection): The connection to communicate with the client.
+        exclude_id (str or None): ID of the object being placed, if it already exists.
+    Returns:
+        str: The world position as "x y z".
+    """
+    position_data = json.loads(position_result)
+    position = resolve_position(
+        position_data['reference_id'], position_data['direction'], position_data['distance'],
+        semantic_graph, scene.models, exclude_id
+    )
+    if position is None:
+        # Request the client to calculate the world position
+        data = await connection.request({
+            "type": "calculate_position",
+            "reference_id": position_data['reference_id'],
+            "direction": position_data['direction'],
+            "distance": position_data['distance']
+        }, "world_position")
+        position = data.get("position")
+    print(f"Calculated Position: {position}")
+    return position
+
+
+async def send_progress(connection, object_id, stage, placeholder=None):
+    """
+    Notify the client about the generation stage of an object being created.
+    Args:
+        connection (ClientConnection): The connection to communicate with the client.
+        object_id (str): The ID of the object being generated.
+        stage (str): The name of the stage that has just started.
+        placeholder (dict or None): An updated placeholder to display, if any.
+    """
+    message = {
+        "type": "model_progress",
+        "object_id": object_id,
+        "stage": stage
+    }
+    if placeholder:
+        message["placeholder"] = placeholder
+    await connection.send(message)
+
+
+async def manipulate_object_pipeline(question, semantic_graph, scene, object_id, final_position, connection):
     """
     Determine the 3D position of an existing object in the scene based on user instructions.
     Args:
         question (str): The user's question or command.
         semantic_graph (dict): The current semantic graph of the environment.
+        scene (Scene): The scene of the connection holding the object.
         object_id (str): The ID of the object to manipulate.
         final_position (dict or None): The final position for the object if already determined.
-        websocket (WebSocket): The WebSocket connection to communicate with the client.
+        connection (ClientConnection): The connection to communicate with the client.
     Returns:
         dict: The updated properties of the manipulated object.
     """
-    # Load existing models
-    with open("../data/models.json", "r") as f:
-        models = json.load(f)
-
-    # Find the object in the models
-    object = next((model for model in models if model['id'] == object_id), None)
+    # Find the object in the scene
+    object = scene.get_model(object_id)
     if not object:
         return (f"Object with ID {object_id} not found in models.")
     
@@ -106,45 +231,28 @@ async def manipulate_object_pipeline(question, semantic_graph, object_id, final_
         # Otherwise, define the position based on the task
         position_result = await define_position(question, semantic_graph)
 
-        # Request the client to calculate the world position
-        position_data = json.loads(position_result)
-        reference_id = position_data['reference_id']
-        direction = position_data['direction']
-        distance = position_data['distance']
-        await websocket.send_text(json.dumps({
-            "type": "calculate_position",
-            "reference_id": reference_id,
-            "direction": direction,
-            "distance": distance
-        }))
-        while True:
-            message = await websocket.receive()
-            if 'text' in message:
-                data = json.loads(message['text'])
-                if data.get("type") == "world_position":
-                    object['position'] = data.get("position")
-                    print(f"Calculated Position: {object['position']}")
-                    break
-    # Save the updated model to the models.json file
-    await save_model(object)
+        # Calculate the world position
+        object['position'] = await calculate_position(position_result, semantic_graph, scene, connection, exclude_id=object_id)
+    # Save the updated model in the scene
+    await scene.save_model(object)
     # Send the new model data to the client
-    await websocket.send_text(json.dumps({
+    await connection.send({
         "type": "new_model",
         "model": object
-    }))
+    })
     print(f"Object: {object['id']} moved to position: {object['position']}")
     return object
 
 
-async def handle_task(task, semantic_graph, nameCounters, final_position, websocket, context=""):
+async def handle_task(task, semantic_graph, scene, final_position, connection, context=""):
     """
     Handle a user's task by classifying it and executing the appropriate pipeline.
     Args:
         task (str): The user's task or command.
         semantic_graph (dict): The current semantic graph of the environment.
-        nameCounters (dict): A dictionary to keep track of object name counts for unique ID generation.
+        scene (Scene): The scene of the connection, used for storage and unique ID generation.
         final_position (dict or None): The final position for the object if already determined.
-        websocket (WebSocket): The WebSocket connection to communicate with the client.
+        connection (ClientConnection): The connection to communicate with the client.
         context (str): Contextual information from previous tasks.
     Returns:
         str: Updated context after handling the task.
@@ -161,6 +269,9 @@ async def handle_task(task, semantic_graph, nameCounters, final_position, websoc
         feedback = "negative"
         while "negative" in feedback.lower():
             subtasks = await divide_tasks(task)
+            # Under load the first division is used without review
+            if admission.degraded("skip_review"):
+                break
             feedback = await reviewer_tasks(task, subtasks)
 
         # Handle each subtask sequentially
@@ -168,37 +279,35 @@ async def handle_task(task, semantic_graph, nameCounters, final_position, websoc
             print("Subtask: ", subtask)
             # Use context from previous tasks
             context = await handle_task(
-                subtask, semantic_graph, nameCounters, final_position, websocket, context
+                subtask, semantic_graph, scene, final_position, connection, context
             )
         return context
 
     # Handle single tasks
     elif response['classification'] == "create":
-        obj = await create_object_pipeline(task, semantic_graph, nameCounters, final_position, websocket)
-        context += f"Created object in previous task: {{'id': {obj['id']}, 'position': {obj['position']}}}\n"
+        obj = await create_object_pipeline(task, semantic_graph, scene, final_position, connection)
+        if obj is None:
+            context += "The object of the previous task could not be created.\n"
+        else:
+            context += f"Created object in previous task: {{'id': {obj['id']}, 'position': {obj['position']}}}\n"
         return context
 
     elif response['classification'] == "manipulate":
         for object_id in response['manipulate_objects']:
-            result = await manipulate_object_pipeline(task, semantic_graph, object_id, final_position, websocket)
+            result = await manipulate_object_pipeline(task, semantic_graph, scene, object_id, final_position, connection)
             context += f"Manipulated object in previous task: {{'id': {result['id']}, 'position': {result['position']}}}\n"
         return context
 
     # Handle delete tasks
     elif response['classification'] == "delete":
         for object_id in response['delete_objects']:
-            # Load existing models
-            with open("../data/models.json", "r") as f:
-                        models = json.load(f)
-            # Remove the object from the models list
-            remaining_models = [m for m in models if m["id"] != object_id]
-            with open("../data/models.json", "w", encoding="utf-8") as f:
-                json.dump(remaining_models, f, indent=2)
+            # Remove the object from the scene
+            await scene.delete_model(object_id)
             # Notify the client to delete the object
-            await websocket.send_text(json.dumps({
+            await connection.send({
                 "type": "delete_object",
                 "object_id": object_id
-            }))
+            })
             context += f"Deleted object {object_id} in previous task.\n"
         return context
 
@@ -207,7 +316,7 @@ async def handle_task(task, semantic_graph, nameCounters, final_position, websoc
         return context
     
 
-async def handle_disambiguation(response, websocket):
+async def handle_disambiguation(response, connection):
     clarification = ""
     
     # Handle cases where object is ambiguous
@@ -219,7 +328,7 @@ async def handle_disambiguation(response, websocket):
                 # Handle each disambiguation phrase
                 for disambiguation_phrase in response["disambiguation_phrases"]:
                     # Extract pointed object from user
-                    pointed_object = await vr_pointed_object(disambiguation_phrase, response["disambiguation_candidates"], websocket)
+                    pointed_object = await vr_pointed_object(disambiguation_phrase, response["disambiguation_candidates"], connection)
                     clarification += f"For the disambiguation phrase {disambiguation_phrase}, the user clarified object: {pointed_object}\n"
     
     # Handle cases where spatial phrases are ambiguous
@@ -227,71 +336,39 @@ async def handle_disambiguation(response, websocket):
         # Handle each spatial phrase
         for spatial_phrase in response["spatial_phrases"]:
             # Ask user to point to the location
-            await websocket.send_text(json.dumps({
-                "type": "start_pointing_location",
-                "spatial_phrase": spatial_phrase
-            }))
-            # Extract pointed location from user
-            pointed_location = await vr_pointed_location(spatial_phrase, websocket)
+            pointed_location = await vr_pointed_location(spatial_phrase, connection)
             clarification += f"For the spatial phrase {spatial_phrase}, the user pointed to location: {pointed_location}\n"
     
     print("Clarification: ", clarification)
     return clarification
 
 
-async def vr_pointed_object(disambiguation_phrase, disambiguation_candidates, websocket):
+async def vr_pointed_object(disambiguation_phrase, disambiguation_candidates, connection):
     # print(f"[VR Prompt] Please point to the object referred to.")
     while True:
         # Ask user to point to the object
-        await websocket.send_text(json.dumps({
+        data = await connection.request({
             "type": "start_pointing_object",
             "disambiguation_phrase": disambiguation_phrase,
             "disambiguation_candidates": disambiguation_candidates
-        }))
-        message = await websocket.receive()
-        if 'text' in message:
-            data = json.loads(message['text'])
-            if data.get("type") == "pointing_object":
-                pointed_object = data.get("object_id")
-                # Validate the pointed object
-                if pointed_object not in disambiguation_candidates:
-                    print(f"User pointed to an unexpected object: '{pointed_object}'. Expected: {disambiguation_candidates}")
-                else:
-                    # print(f"[VR Response] User pointed to object: {pointed_object}")
-                    return pointed_object 
-
-async def vr_pointed_location(spatial_phrase, websocket):
+        }, "pointing_object")
+        pointed_object = data.get("object_id")
+        # Validate the pointed object
+        if pointed_object not in disambiguation_candidates:
+            print(f"User pointed to an unexpected object: '{pointed_object}'. Expected: {disambiguation_candidates}")
+        else:
+            # print(f"[VR Response] User pointed to object: {pointed_object}")
+            return pointed_object 
+
+async def vr_pointed_location(spatial_phrase, connection):
     # print(f"[VR Prompt] Please point to the location referred to by '{spatial_phrase}'.")
-    while True:
-        message = await websocket.receive()
-        if 'text' in message:
-            data = json.loads(message['text'])
-            if data.get("type") == "pointing_location":
-                pointed_location = data.get("position")
-                # print(f"[VR Response] User pointed to location: {pointed_location}")
-                # Avoid placing objects below the ground
-                if pointed_location['y'] < 0.5:
-                    pointed_location['y'] = 0.5
-                return pointed_location
-            
-async def save_model(model_data):
-    # Load existing models
-    if os.path.exists("../data/models.json"):
-        with open("../data/models.json", "r") as f:
-            models = json.load(f)
-    else: # If file doesn't exist, start with empty list
-        models = []
-    
-    # Check if the model already exists and update it
-    updated = False
-    for i, model in enumerate(models):
-        if model['id'] == model_data['id']:
-            models[i] = model_data
-            updated = True
-            break
-    # If the model is not found, append it
-    if not updated:
-        models.append(model_data)
-    with open("../data/models.json", "w") as f:
-        json.dump(models, f, indent=2)
-    print(f"Model {model_data['id']} saved successfully.") 
\ No newline at end of file
+    data = await connection.request({
+        "type": "start_pointing_location",
+        "spatial_phrase": spatial_phrase
+    }, "pointing_location")
+    pointed_location = data.get("position")
+    # print(f"[VR Response] User pointed to location: {pointed_location}")
+    # Avoid placing objects below the ground
+    if pointed_location['y'] < 0.5:
+        pointed_location['y'] = 0.5
+    return pointed_location
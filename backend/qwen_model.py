@@ -1,13 +1,21 @@
+import time
+
 import httpx
 
+from config import QWEN_SERVER_URL
+from session_log import current_session_log
+from tracing import current_trace, span
+
 async def qwen_model(
     messages,
-    server_url="http://10.10.78.11:8080/v1/chat/completions",
+    stage,
+    server_url=QWEN_SERVER_URL,
 ):
     """
     Sends a question to the Qwen model server and returns the response.
     Args:
         messages (list): A list of message dictionaries for the chat completion.
+        stage (str): Name of the call in traces and session logs (classify_task, describe_object, ...).
         server_url (str): The URL of the Qwen model server.
     Returns:
         str: The response from the Qwen model.
@@ -16,10 +24,26 @@ async def qwen_model(
     payload = {
         "messages": messages
     }
-    response = await client.post(server_url, json=payload)
+    start = time.perf_counter()
+    with span(f"qwen_model.{stage}"):
+        response = await client.post(server_url, json=payload)
 
     if response.status_code == 200:
-        return response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+        content = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
     else:
         print(f"Request failed with status code {response.status_code}: {response.text}")
-        return None
\ No newline at end of file
+        content = None
+
+    # Captured sessions keep every call so they can be replayed without the model
+    session_log = current_session_log.get()
+    if session_log is not None:
+        trace = current_trace.get()
+        session_log.write(
+            "llm",
+            request_id=trace.request_id if trace else None,
+            caller=stage,
+            messages=messages,
+            response=content,
+            duration=time.perf_counter() - start
+        )
+    return content
\ No newline at end of file
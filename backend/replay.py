@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+
+# Client messages answering a server request, sent back when the server asks instead of at their recorded time
+REPLY_TYPES = {
+    "calculate_position": "world_position",
+    "start_pointing_object": "pointing_object",
+    "start_pointing_location": "pointing_location",
+}
+# Traced stage of each model stand-in, used to take its latency from the recording
+STAND_IN_STAGES = {
+    "asr": "transcribe_audio",
+    "sd": "generate_image",
+    "hunyuan": "generate_3D_model",
+    "blip": "color_extractor",
+}
+
+
+def seed_models(session, models_dir, work_dir):
+    """
+    Link the models of the recorded asset library and scene into the temporary project, so the replay reuses
+    the same assets as the session. Sessions recorded without their library get every model of models_dir.
+    Args:
+        session (dict): The "session" event.
+        models_dir (str): The models directory of the project.
+        work_dir (str): The temporary project.
+    Returns:
+        int: Number of linked models.
+        int: Number of recorded models missing from models_dir.
+    """
+    if "assets" in session:
+        paths = {path for asset in session["assets"] for path in [asset["path"]] + list(asset.get("lods") or [])}
+    else:
+        paths = {f"models/{name}" for name in os.listdir(models_dir) if name.endswith(".glb")}
+    paths.update(path for model in session["models"] for path in [model.get("path")] + list(model.get("lods") or []) if path)
+
+    linked, missing = 0, 0
+    for path in paths:
+        # Paths are stored as seen by the frontend, e.g. "../../models/chair1.glb"
+        directory, _, file_name = re.sub(r"^(\.\./)+", "", path).partition("/")
+        if directory != "models" or not file_name:
+            continue
+        source = os.path.join(models_dir, file_name)
+        target = os.path.join(work_dir, "models", file_name)
+        if not os.path.exists(source):
+            missing += 1
+        elif not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.symlink(source, target)
+            linked += 1
+    return linked, missing
+
+
+def message_key(messages):
+    return hashlib.sha1(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+
+class RecordedLLM:
+    """
+    Serves the qwen_model responses recorded in a session. A request gets the response recorded for the same
+    messages, or when the prompts changed, the next unused response recorded for the same system message.
+    """
+
+    def __init__(self, events):
+        self.by_messages = defaultdict(deque)
+        self.by_system = defaultdict(deque)
+        for event in events:
+            if event["type"] == "llm":
+                entry = {"response": event["response"], "duration": event["duration"], "used": False}
+                self.by_messages[message_key(event["messages"])].append(entry)
+                self.by_system[event["messages"][0]["content"]].append(entry)
+        self.matches = defaultdict(int)
+
+    def respond(self, messages):
+        """
+        Get the recorded response for a request.
+        Args:
+            messages (list): The chat completion messages.
+        Returns:
+            dict or None: The recorded response and duration, or None if nothing matches.
+        """
+        for match, entries in (("exact", self.by_messages.get(message_key(messages))),
+                               ("prompt", self.by_system.get(messages[0]["content"]))):
+            while entries:
+                entry = entries.popleft()
+                if not entry["used"]:
+                    entry["used"] = True
+                    self.matches[match] += 1
+                    return entry
+        self.matches["missing"] += 1
+        return None
+
+
+def create_llm_app(recorded_llm, latency_scale):
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        entry = recorded_llm.respond(payload["messages"])
+        if entry is None:
+            return {"choices": [{"message": {"role": "assistant", "content": ""}}]}
+        await asyncio.sleep(entry["duration"] * latency_scale)
+        return {"choices": [{"message": {"role": "assistant", "content": entry["response"] or ""}}]}
+
+    return app
+
+
+def recorded_stages(events):
+    """
+    Collect the recorded durations of every stage from the utterance traces.
+    Args:
+        events (list): The session events.
+    Returns:
+        dict: List of durations per stage, including "utterance".
+    """
+    durations = defaultdict(list)
+    for event in events:
+        if event["type"] == "utterance":
+            durations["utterance"].append(event["trace"]["duration"])
+            for span in event["trace"]["spans"]:
+                durations[span["stage"]].append(span["duration"])
+    return durations
+
+
+async def replay_client(url, events, audio, speed, results):
+    """
+    Re-send the client side of a session: snapshots, deltas and audio at their recorded times (divided by speed),
+    and the recorded replies whenever the server sends a request.
+    Args:
+        url (str): WebSocket URL of the backend, including the scene.
+        events (list): The session events.
+        audio (np.ndarray): The recorded audio samples.
+        speed (float): Replay speed, 0 sends everything without waiting.
+        results (list): List where the utterance_complete messages are appended.
+    """
+    import websockets
+    from connection import HeadlessConnection
+
+    replies = defaultdict(deque)
+    scheduled = []
+    version = 0
+    for event in events:
+        if event["type"] == "client":
+            message = event["message"]
+            if message.get("type") in REPLY_TYPES.values():
+                replies[message["type"]].append(message)
+            else:
+                # Deltas were merged when logged, they are renumbered to follow the snapshot they apply to
+                if message.get("type") == "environment_data":
+                    version = message.get("version", 0)
+                elif message.get("type") == "scene_delta":
+                    version += 1
+                    message = dict(message, seq=version)
+                scheduled.append((event["t"], json.dumps(message)))
+        elif event["type"] == "audio":
+            scheduled.append((event["t"], audio[event["offset"]:event["offset"] + event["samples"]].tobytes()))
+    utterances = sum(isinstance(data, bytes) for _, data in scheduled)
+    # Mirror of the scene, answering the requests that have no recorded reply
+    session = next(event for event in events if event["type"] == "session")
+    headless = HeadlessConnection(session["models"])
+
+    async with websockets.connect(url, max_size=None) as ws:
+        json.loads(await ws.recv())  # session
+
+        async def send_scheduled():
+            start = time.perf_counter()
+            for t, data in scheduled:
+                if speed > 0:
+                    await asyncio.sleep(max(start + t / speed - time.perf_counter(), 0))
+                await ws.send(data)
+
+        sender = asyncio.create_task(send_scheduled())
+        while len(results) < utterances:
+            data = json.loads(await ws.recv())
+            await headless.send(data)
+            if data["type"] in REPLY_TYPES:
+                reply_type = REPLY_TYPES[data["type"]]
+                if replies[reply_type]:
+                    reply = dict(replies[reply_type].popleft())
+                else:
+                    # The replayed pipeline asked more than the recorded one, answer like a headless client
+                    print(f"No recorded {reply_type} left, answering a default")
+                    try:
+                        reply = await headless.request(data, reply_type)
+                    except ValueError as e:
+                        print(f"{e}, placing it relative to the user")
+                        reply = await headless.request(dict(data, reference_id="user"), reply_type)
+                reply["request_id"] = data["request_id"]
+                await ws.send(json.dumps(reply))
+            elif data["type"] == "utterance_complete":
+                results.append(data)
+        await sender
+
+
+async def run_replay(args, events, audio):
+    import main
+    import mock_backends
+    from asset_library import load_asset_library
+    from session_log import audio_key
+    from tracing import stage_samples
+
+    session = next(event for event in events if event["type"] == "session")
+    # The asset library starts as it was when the session was recorded
+    if "assets" in session:
+        library = load_asset_library()
+        library.assets = {}
+        for asset in session["assets"]:
+            library.add(asset["name"], asset["color"], asset["path"], asset["lods"])
+    scene = main.scene_manager.open(session["scene_id"])
+    for name, counter in session.get("id_counters", {}).items():
+        scene.ids.reserve(f"{name}{counter}")
+
+    # Model stand-ins take the median latency recorded for their stage
+    servers = []
+    if not args.real_models:
+        durations = recorded_stages(events)
+        latencies = dict(mock_backends.DEFAULT_LATENCIES)
+        for stage, traced_stage in STAND_IN_STAGES.items():
+            if durations.get(traced_stage):
+                latencies[stage] = float(np.median(durations[traced_stage]))
+        transcriptions = {event["audio_key"]: event["transcription"] for event in events
+                          if event["type"] == "utterance" and event.get("transcription")}
+        for event in events:
+            if event["type"] == "audio":
+                audio_data = audio[event["offset"]:event["offset"] + event["samples"]].tobytes()
+                transcription = transcriptions.get(audio_key(audio_data))
+                if transcription:
+                    mock_backends.register_utterance(audio_data, transcription)
+        mock_backends.install(latencies)
+        servers.append(mock_backends.start_server(mock_backends.create_hunyuan_app(latencies["hunyuan"]), args.hunyuan_port))
+
+    recorded_llm = RecordedLLM(events)
+    servers.append(mock_backends.start_server(create_llm_app(recorded_llm, args.llm_latency_scale), args.qwen_port))
+
+    server, server_task = await mock_backends.start_backend(main.app, args.port)
+
+    results = []
+    start = time.perf_counter()
+    url = f"ws://127.0.0.1:{args.port}/ws?scene={session['scene_id']}"
+    try:
+        await asyncio.wait_for(replay_client(url, events, audio, args.speed, results), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Replay timed out after {args.timeout} s")
+    elapsed = time.perf_counter() - start
+
+    server.should_exit = True
+    await server_task
+    for mock_server in servers:
+        mock_server.should_exit = True
+    main.scene_manager.close(scene)
+
+    return {
+        "session": args.session,
+        "elapsed": elapsed,
+        "recorded_duration": events[-1]["t"] if events else 0.0,
+        "utterances": len(results),
+        "statuses": dict(Counter(result["status"] for result in results)),
+        "llm_matches": dict(recorded_llm.matches),
+        "recorded": summarize(recorded_stages(events)),
+        "replay": summarize({stage: list(samples) for stage, samples in stage_samples.items()}),
+    }
+
+
+def summarize(durations):
+    summary = {}
+    for stage, values in sorted(durations.items()):
+        if values:
+            p50, p95 = np.percentile(values, [50, 95])
+            summary[stage] = {"count": len(values), "p50": float(p50), "p95": float(p95)}
+    return summary
+
+
+def print_report(report):
+    print(f"\nReplayed {report['utterances']} utterances in {report['elapsed']:.1f} s "
+          f"(recorded session: {report['recorded_duration']:.1f} s), statuses: {report['statuses']}")
+    print(f"LLM responses: {report['llm_matches']}")
+    print("\nStage                                  recorded p50  replay p50  recorded p95  replay p95  (ms)")
+    for stage in sorted(set(report["recorded"]) | set(report["replay"])):
+        recorded, replayed = report["recorded"].get(stage), report["replay"].get(stage)
+        columns = []
+        for key in ("p50", "p95"):
+            columns.append(f"{recorded[key] * 1000:>12.1f}" if recorded else f"{'-':>12}")
+            columns.append(f"{replayed[key] * 1000:>11.1f}" if replayed else f"{'-':>11}")
+        print(f"{stage:<38} {columns[0]} {columns[1]} {columns[2]} {columns[3]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a captured session against the current backend.")
+    parser.add_argument("session", help="Directory of the captured session.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 0 sends every message without waiting.")
+    parser.add_argument("--llm-latency-scale", type=float, default=1.0, help="Scale of the recorded LLM latencies, 0 answers at once.")
+    parser.add_argument("--real-models", action="store_true", help="Run Whisper, Stable Diffusion, BLIP and Hunyuan3D instead of stand-ins.")
+    parser.add_argument("--port", type=int, default=8200, help="Port of the backend under test.")
+    parser.add_argument("--qwen-port", type=int, default=8201, help="Port of the recorded Qwen server.")
+    parser.add_argument("--hunyuan-port", type=int, default=8202, help="Port of the Hunyuan3D stand-in.")
+    parser.add_argument("--timeout", type=float, default=3600, help="Maximum duration of the replay, in seconds.")
+    parser.add_argument("--models-dir", default="../models", help="Models directory of the project, linked into the replay.")
+    parser.add_argument("--output", help="Save the report as JSON.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary directory with the generated files.")
+    args = parser.parse_args()
+
+    from mock_backends import create_work_dir
+    from session_log import load_session
+
+    args.session = os.path.abspath(args.session)
+    events, audio = load_session(args.session)
+    session = next(event for event in events if event["type"] == "session")
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Point the backend at the recorded Qwen server before its modules are imported
+    os.environ["QWEN_SERVER_URL"] = f"http://127.0.0.1:{args.qwen_port}/v1/chat/completions"
+    if not args.real_models:
+        os.environ["HUNYUAN_SERVER_URL"] = f"http://127.0.0.1:{args.hunyuan_port}/generate"
+        os.environ["PRELOAD_MODELS"] = "0"
+    os.environ["CAPTURE_SESSIONS"] = "0"
+
+    # The replay starts from the recorded scene in a temporary copy of the project layout
+    models_dir = os.path.abspath(args.models_dir)
+    work_dir = create_work_dir("voiceto3d_replay_")
+    if session["scene_id"] == "default":
+        models_file = os.path.join(work_dir, "data", "models.json")
+    else:
+        models_file = os.path.join(work_dir, "data", "scenes", session["scene_id"], "models.json")
+        os.makedirs(os.path.dirname(models_file))
+    with open(models_file, "w") as f:
+        json.dump(session["models"], f, indent=2)
+    # With the recorded models, so the same assets are reused instead of generated
+    linked, missing = seed_models(session, models_dir, work_dir)
+    print(f"Linked {linked} models from {args.models_dir}" + (f", {missing} recorded models are missing" if missing else ""))
+
+    try:
+        report = asyncio.run(run_replay(args, events, audio))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print_report(report)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
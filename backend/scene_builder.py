@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+from admission import admission
+from connection import HeadlessConnection
+from main import main as run_workflow, scene_manager
+from tracing import finish_trace, start_trace
+
+# Stages that run on the GPU, summed as the GPU cost of a command
+GPU_STAGES = ("generate_image", "generate_3D_model", "color_extractor")
+
+
+def load_commands(commands_path):
+    """
+    Load a commands file: one text command per line, or JSON lines with a "text" field
+    (like the benchmark scripts). Empty lines and lines starting with # are skipped.
+    Args:
+        commands_path (str): Path to the file.
+    Returns:
+        list: The commands.
+    """
+    commands = []
+    with open(commands_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            commands.append(json.loads(line)["text"] if line.startswith("{") else line)
+    return commands
+
+
+def command_cost(trace_data):
+    """
+    Summarize the cost of a command from its trace.
+    Args:
+        trace_data (dict): The finished trace.
+    Returns:
+        dict: Wall time, number of LLM calls, GPU seconds and time per stage.
+    """
+    stages = defaultdict(float)
+    for span in trace_data["spans"]:
+        stages[span["stage"]] += span["duration"]
+    return {
+        "time": trace_data["duration"],
+        "llm_calls": sum(span["stage"].startswith("qwen_model") for span in trace_data["spans"]),
+        "gpu_seconds": sum(stages[stage] for stage in GPU_STAGES),
+        "stages": dict(stages),
+    }
+
+
+async def run_command(index, text, scene, connection, semaphore, results):
+    """
+    Run one text command through the main workflow, as if it had been transcribed.
+    Args:
+        index (int): Position of the command in the file.
+        text (str): The command.
+        scene (Scene): The target scene.
+        connection (HeadlessConnection): The headless stand-in for the client.
+        semaphore (asyncio.Semaphore): Limits the number of commands running at once.
+        results (list): List where the result of each command is appended.
+    """
+    async with semaphore:
+        trace = start_trace()
+        try:
+            await run_workflow(text, connection.scene_graph.semantic_graph(), scene, connection)
+            status = "done"
+        except Exception as e:
+            print(f"Error in command {index + 1} ({text}): {e}")
+            status = "failed"
+        finally:
+            trace_data = finish_trace(trace)
+        results.append({
+            "index": index,
+            "text": text,
+            "status": status,
+            "request_id": trace.request_id,
+            **command_cost(trace_data),
+        })
+        print(f"[{len(results)}] {status}: {text} ({trace_data['duration']:.1f} s)")
+
+
+async def build_scene(commands, scene_id, concurrency, pointing_location):
+    """
+    Run a list of commands against a scene and report their cost.
+    Args:
+        commands (list): The text commands.
+        scene_id (str): The target scene.
+        concurrency (int): Number of commands running at once, 1 keeps them in order.
+        pointing_location (tuple): Location answered when a command needs pointing.
+    Returns:
+        dict: Throughput, totals and per-command results.
+    """
+    scene = scene_manager.open(scene_id)
+    connection = HeadlessConnection(scene.models, pointing_location)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    models_before = len(scene.models)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_command(index, text, scene, connection, semaphore, results)
+                               for index, text in enumerate(commands)))
+    finally:
+        elapsed = time.perf_counter() - start
+        scene_manager.close(scene)
+
+    results.sort(key=lambda result: result["index"])
+    return {
+        "scene": scene.scene_id,
+        "models_file": scene.models_file,
+        "commands": len(results),
+        "failed": sum(result["status"] != "done" for result in results),
+        "objects": len(scene.models) - models_before,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed > 0 else 0.0,
+        "llm_calls": sum(result["llm_calls"] for result in results),
+        "gpu_seconds": sum(result["gpu_seconds"] for result in results),
+        "results": results,
+    }
+
+
+def print_report(report):
+    print(f"\n{'#':>3} {'status':<7} {'time (s)':>9} {'LLM calls':>10} {'GPU (s)':>8}  command")
+    for result in report["results"]:
+        print(f"{result['index'] + 1:>3} {result['status']:<7} {result['time']:>9.1f} {result['llm_calls']:>10} "
+              f"{result['gpu_seconds']:>8.1f}  {result['text']}")
+    print(f"\nScene {report['scene']}: {report['commands']} commands ({report['failed']} failed), "
+          f"{report['objects']} new objects in {report['elapsed']:.1f} s with concurrency {report['concurrency']}")
+    print(f"Throughput: {report['throughput'] * 60:.2f} commands/min, {report['llm_calls']} LLM calls, "
+          f"{report['gpu_seconds']:.1f} GPU seconds")
+    print(f"Scene saved to {report['models_file']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a scene from a file of text commands, without a headset.")
+    parser.add_argument("commands", help="Text file with one command per line (or JSON lines with a \"text\" field).")
+    parser.add_argument("--scene", default="default", help="Target scene id.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Commands run at once, 1 keeps them in order.")
+    parser.add_argument("--pointing-location", type=float, nargs=3, default=(0.0, 0.5, -1.0), metavar=("X", "Y", "Z"),
+                        help="Location answered when a command points somewhere (e.g. \"here\").")
+    parser.add_argument("--output", help="Save the full report as JSON.")
+    args = parser.parse_args()
+
+    # A batch build favors quality over latency
+    admission.enabled = False
+    report = asyncio.run(build_scene(load_commands(args.commands), args.scene, max(args.concurrency, 1), tuple(args.pointing_location)))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import re
+import threading
+
+DEFAULT_SCENE = "default"
+SCENE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+OBJECT_ID_PATTERN = re.compile(r"^(.*?)(\d+)$")
+
+
+def scene_files(scene_id, data_dir="../data"):
+    """
+    Files of a scene: the default scene keeps using ../data/models.json, other scenes live in ../data/scenes/<scene_id>/.
+    Args:
+        scene_id (str): The scene id.
+        data_dir (str): The data directory.
+    Returns:
+        str: Path of the models file, with the object records.
+        str: Path of the id counters file, next to it.
+    """
+    if scene_id == DEFAULT_SCENE:
+        return os.path.join(data_dir, "models.json"), os.path.join(data_dir, "id_counters.json")
+    scene_dir = os.path.join(data_dir, "scenes", scene_id)
+    return os.path.join(scene_dir, "models.json"), os.path.join(scene_dir, "id_counters.json")
+
+
+def write_json(path, data):
+    # Write to a temporary file first so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_file, path)
+
+
+class IdAllocator:
+    """
+    Allocates object ids of the form <name><counter> for a scene, never handing out an id twice.
+    Keeps the highest counter of each name, saved to the counters file whenever it grows,
+    so ids of deleted objects are not handed out again after a restart.
+    """
+
+    def __init__(self, used_ids=(), counters_file=None):
+        self.lock = threading.Lock()
+        self.counters_file = counters_file
+        self.counters = {}
+        if counters_file and os.path.exists(counters_file):
+            try:
+                with open(counters_file, "r") as f:
+                    self.counters = {name: int(counter) for name, counter in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                print(f"Error loading {counters_file}: {e}")
+        self.reserve(*used_ids)
+
+    def _save(self):
+        # Called with the lock held, so saves happen in the order the counters grow
+        if self.counters_file:
+            write_json(self.counters_file, self.counters)
+
+    def reserve(self, *object_ids):
+        """
+        Mark existing ids as used.
+        Args:
+            *object_ids (str): The object IDs.
+        """
+        with self.lock:
+            grown = False
+            for object_id in object_ids:
+                match = OBJECT_ID_PATTERN.match(object_id)
+                if match and int(match.group(2)) > self.counters.get(match.group(1), 0):
+                    self.counters[match.group(1)] = int(match.group(2))
+                    grown = True
+            if grown:
+                self._save()
+
+    def allocate(self, name):
+        """
+        Allocate a new id for an object name.
+        Args:
+            name (str): The base name of the object.
+        Returns:
+            str: A unique ID for the object.
+        """
+        with self.lock:
+            # Counters only grow, so ids of deleted objects (and their assets) are never reused
+            counter = self.counters.get(name, 0) + 1
+            self.counters[name] = counter
+            self._save()
+        return f"{name}{counter}"
+
+
+class Scene:
+    """
+    A scene shared by the connections that opened it, with its own models file and id allocation (see scene_files).
+    """
+
+    def __init__(self, scene_id, data_dir="../data", ids=None):
+        self.scene_id = scene_id
+        self.models_file, counters_file = scene_files(scene_id, data_dir)
+        self.lock = asyncio.Lock()
+        self.connections = 0
+        self.models = self._load()
+
+        # Ids are allocated by the server, including the ids of the stored objects
+        self.ids = ids or IdAllocator(counters_file=counters_file)
+        self.ids.reserve(*(model["id"] for model in self.models))
+
+        # Objects left pending by a generation that never finished (e.g. a crash), or stored as failed,
+        # are dropped: generations only run while a connection has the scene open
+        unfinished = [model["id"] for model in self.models if model.get("status") in ("pending", "failed")]
+        if unfinished:
+            print(f"Dropping unfinished objects from scene {scene_id}: {', '.join(unfinished)}")
+            self.models = [model for model in self.models if model.get("status") not in ("pending", "failed")]
+            self._write()
+
+    def _load(self):
+        if os.path.exists(self.models_file):
+            with open(self.models_file, "r") as f:
+                return json.load(f)
+        return []
+
+    def _write(self):
+        write_json(self.models_file, self.models)
+
+    def asset_name(self, object_id):
+        """
+        Name of the image/model files generated for an object of this scene.
+        Generated assets are shared between scenes and never overwritten, so names are unique per scene.
+        Args:
+            object_id (str): The ID of the object in the scene.
+        Returns:
+            str: The file name (without extension) of the object's assets.
+        """
+        if self.scene_id == DEFAULT_SCENE:
+            return object_id
+        return f"{self.scene_id}_{object_id}"
+
+    def allocate_id(self, name):
+        """
+        Allocate a new, unused object ID.
+        Args:
+            name (str): The base name of the object.
+        Returns:
+            str: A unique ID for the object.
+        """
+        return self.ids.allocate(name)
+
+    def get_model(self, object_id):
+        """
+        Get the stored record of an object.
+        Args:
+            object_id (str): The ID of the object.
+        Returns:
+            dict or None: A copy of the object's record, or None if not found.
+        """
+        model = next((model for model in self.models if model['id'] == object_id), None)
+        return dict(model) if model else None
+
+    async def add_model(self, model_data):
+        """
+        Add a new object's record and persist the scene.
+        Args:
+            model_data (dict): The object's record, with an ID from allocate_id.
+        """
+        async with self.lock:
+            if any(model['id'] == model_data['id'] for model in self.models):
+                raise ValueError(f"Object {model_data['id']} already exists in scene {self.scene_id}")
+            self.ids.reserve(model_data['id'])
+            self.models.append(dict(model_data))
+            self._write()
+        print(f"Model {model_data['id']} added successfully in scene {self.scene_id}.")
+
+    async def save_model(self, model_data):
+        """
+        Add or update an object's record and persist the scene.
+        Args:
+            model_data (dict): The object's record.
+        """
+        async with self.lock:
+            self.ids.reserve(model_data['id'])
+            # Check if the model already exists and update it
+            for i, model in enumerate(self.models):
+                if model['id'] == model_data['id']:
+                    self.models[i] = dict(model_data)
+                    break
+            # If the model is not found, append it
+            else:
+                self.models.append(dict(model_data))
+            self._write()
+        print(f"Model {model_data['id']} saved successfully in scene {self.scene_id}.")
+
+    async def update_model(self, model_data):
+        """
+        Update the record of an object still in the scene, keeping its stored position.
+        Used while an object is generated, so that deleting or moving it meanwhile is not undone.
+        Args:
+            model_data (dict): The object's record.
+        Returns:
+            dict or None: A copy of the stored record, or None if the object was deleted.
+        """
+        async with self.lock:
+            for i, model in enumerate(self.models):
+                if model['id'] == model_data['id']:
+                    self.models[i] = dict(model_data, position=model.get('position'))
+                    self._write()
+                    return dict(self.models[i])
+        print(f"Model {model_data['id']} was deleted from scene {self.scene_id}, not updating it.")
+        return None
+
+    async def delete_model(self, object_id):
+        """
+        Remove an object's record and persist the scene.
+        Args:
+            object_id (str): The ID of the object to remove.
+        """
+        async with self.lock:
+            self.models = [model for model in self.models if model['id'] != object_id]
+            self._write()
+
+
+class SceneManager:
+    """
+    Keeps one Scene per scene id in memory while at least one connection uses it.
+    The id allocators outlive the scenes and save their counters next to the scene records.
+    """
+
+    def __init__(self, data_dir="../data", asset_dirs=("../models", "../images")):
+        self.data_dir = data_dir
+        self.scenes = {}
+        self.allocators = {}
+
+        # Names of the generated asset files, scanned once so ids never point at an existing asset,
+        # including the assets of scenes created before their counters were saved
+        self.asset_names = set()
+        for asset_dir in asset_dirs:
+            if os.path.isdir(asset_dir):
+                with os.scandir(asset_dir) as entries:
+                    self.asset_names.update(os.path.splitext(entry.name)[0] for entry in entries if entry.is_file())
+
+    def _allocator(self, scene_id):
+        if scene_id not in self.allocators:
+            if scene_id == DEFAULT_SCENE:
+                used_ids = self.asset_names
+            else:
+                prefix = f"{scene_id}_"
+                used_ids = [name[len(prefix):] for name in self.asset_names if name.startswith(prefix)]
+            self.allocators[scene_id] = IdAllocator(used_ids, scene_files(scene_id, self.data_dir)[1])
+        return self.allocators[scene_id]
+
+    def open(self, scene_id=None):
+        """
+        Open a scene for a new connection, loading it if no other connection uses it.
+        Args:
+            scene_id (str or None): The requested scene id, the default scene if not given.
+        Returns:
+            Scene: The opened scene.
+        """
+        scene_id = scene_id or DEFAULT_SCENE
+        if not SCENE_ID_PATTERN.match(scene_id):
+            raise ValueError(f"Invalid scene id: {scene_id}")
+        if scene_id not in self.scenes:
+            self.scenes[scene_id] = Scene(scene_id, self.data_dir, self._allocator(scene_id))
+        scene = self.scenes[scene_id]
+        scene.connections += 1
+        return scene
+
+    def close(self, scene):
+        """
+        Release a scene when its connection ends, unloading it once unused.
+        Args:
+            scene (Scene): The scene to release.
+        """
+        scene.connections -= 1
+        if scene.connections <= 0:
+            self.scenes.pop(scene.scene_id, None)
@@ -0,0 +1,59 @@
+class SceneGraph:
+    """
+    Authoritative copy of a client's semantic graph, kept in sync with versioned deltas.
+    - A full snapshot ("environment_data" message) replaces the graph and sets its version.
+    - A delta ("scene_delta" message) with sequence number version + 1 applies add/update/remove operations.
+    - A delta with any other sequence number is rejected, and the client must send a new snapshot.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.version = 0
+        self.synced = False
+        self._graph = None
+
+    def apply_snapshot(self, semantic_graph, version=0):
+        """
+        Replace the whole graph with a snapshot from the client.
+        Args:
+            semantic_graph (list): List of nodes of the scene.
+            version (int): Version of the snapshot.
+        """
+        self.nodes = {node["id"]: node for node in semantic_graph or []}
+        self.version = version
+        self.synced = True
+        self._graph = None
+
+    def apply_delta(self, seq, ops):
+        """
+        Apply a delta from the client on top of the current version.
+        Args:
+            seq (int): Sequence number of the delta, must be the current version + 1.
+            ops (list): Operations, each one of:
+                {"op": "add" or "update", "node": {...}} or {"op": "remove", "id": "..."}.
+        Returns:
+            bool: True if the delta was applied, False if a snapshot is needed.
+        """
+        if not self.synced or seq != self.version + 1:
+            self.synced = False
+            return False
+
+        for op in ops:
+            if op["op"] in ("add", "update"):
+                # Nodes are replaced, never mutated, so graphs handed out earlier stay unchanged
+                self.nodes[op["node"]["id"]] = op["node"]
+            elif op["op"] == "remove":
+                self.nodes.pop(op["id"], None)
+        self.version = seq
+        self._graph = None
+        return True
+
+    def semantic_graph(self):
+        """
+        Get the current semantic graph.
+        Returns:
+            list: List of nodes of the scene, the same list until the graph changes.
+        """
+        if self._graph is None:
+            self._graph = list(self.nodes.values())
+        return self._graph
@@ -0,0 +1,141 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# Log of the session handled in the current context, None when sessions are not captured
+current_session_log = contextvars.ContextVar("current_session_log", default=None)
+# Scene deltas of this window (seconds) are logged as one, the VR client sends one for every frame with a change
+DELTA_WINDOW = 0.5
+
+
+class SessionLog:
+    """
+    Append-only log of a client session, written to its own directory:
+    - events.jsonl: one JSON event per line, with its time in seconds since the start of the session.
+    - audio.f32: raw float32 audio of every utterance back to back, referenced from the events by sample offset.
+    Events:
+    - "session": scene id, scene records, id counters and asset library when the session started.
+    - "client": a JSON message from the client (snapshots, deltas and replies to requests). Consecutive deltas
+      are merged over DELTA_WINDOW, keeping the last operation on each node and the sequence number of the last delta.
+    - "audio": an utterance, as offset and number of samples in audio.f32.
+    - "llm": a qwen_model call with its caller, messages, response and duration.
+    - "utterance": the audio key, transcription, status and trace (stage timings) of a handled utterance.
+    """
+
+    def __init__(self, session_dir):
+        os.makedirs(session_dir, exist_ok=True)
+        self.session_dir = session_dir
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events_file = open(os.path.join(session_dir, "events.jsonl"), "a", buffering=1)
+        self.audio_file = open(os.path.join(session_dir, "audio.f32"), "ab")
+        self.audio_samples = self.audio_file.tell() // 4
+        # Deltas not logged yet: time of the first and last one, sequence number of the last one and operations by node id
+        self.delta = None
+
+    def write(self, event_type, **data):
+        """
+        Append an event to the log.
+        Args:
+            event_type (str): Type of the event.
+            **data: Fields of the event, JSON serializable.
+        """
+        event = {"t": round(time.perf_counter() - self.start, 4), "type": event_type, **data}
+        with self.lock:
+            # Events stay in order, the pending deltas come before this one
+            self.flush_delta()
+            self.events_file.write(json.dumps(event) + "\n")
+
+    def write_delta(self, message):
+        """
+        Log a "scene_delta" message from the client, merged with the other deltas of its window.
+        Args:
+            message (dict): The delta, with its sequence number and operations.
+        """
+        t = round(time.perf_counter() - self.start, 4)
+        with self.lock:
+            if self.delta is not None and t - self.delta["start"] >= DELTA_WINDOW:
+                self.flush_delta()
+            if self.delta is None:
+                self.delta = {"start": t, "ops": {}}
+            for op in message.get("ops", []):
+                node_id = op["node"]["id"] if "node" in op else op["id"]
+                # Moved to the end, so the operations keep the order of their last change
+                self.delta["ops"].pop(node_id, None)
+                self.delta["ops"][node_id] = op
+            self.delta["t"] = t
+            self.delta["seq"] = message.get("seq")
+
+    def flush_delta(self):
+        # Called with the lock held
+        if self.delta is None:
+            return
+        message = {"type": "scene_delta", "seq": self.delta["seq"], "ops": list(self.delta["ops"].values())}
+        self.events_file.write(json.dumps({"t": self.delta["t"], "type": "client", "message": message}) + "\n")
+        self.delta = None
+
+    def write_audio(self, audio_data):
+        """
+        Append the audio of an utterance to audio.f32 and log where it is.
+        Args:
+            audio_data (bytes): Audio data in float32 format.
+        """
+        with self.lock:
+            offset = self.audio_samples
+            self.audio_file.write(audio_data)
+            self.audio_file.flush()
+            self.audio_samples += len(audio_data) // 4
+        self.write("audio", offset=offset, samples=len(audio_data) // 4)
+
+    def close(self):
+        with self.lock:
+            self.flush_delta()
+            self.events_file.close()
+            self.audio_file.close()
+
+
+def audio_key(audio_data):
+    """Identify the audio of an utterance, to match it with its transcription when replaying."""
+    return hashlib.sha1(bytes(audio_data)).hexdigest()
+
+
+def open_session_log(capture_dir, scene, assets=()):
+    """
+    Start the log of a new session.
+    Args:
+        capture_dir (str): Directory where sessions are captured.
+        scene (Scene): The scene of the session.
+        assets (list): The assets of the library, so a replay reuses the same models.
+    Returns:
+        SessionLog: The log, in <capture_dir>/<time>_<scene_id>_<random suffix>/.
+    """
+    session_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{scene.scene_id}_{uuid.uuid4().hex[:6]}"
+    session_log = SessionLog(os.path.join(capture_dir, session_id))
+    session_log.write("session", scene_id=scene.scene_id, models=scene.models, id_counters=dict(scene.ids.counters),
+                      assets=list(assets))
+    return session_log
+
+
+def load_session(session_dir):
+    """
+    Read a captured session.
+    Args:
+        session_dir (str): Directory of the session.
+    Returns:
+        list: The events, in order.
+        np.ndarray: The audio samples, memory-mapped from audio.f32.
+    """
+    with open(os.path.join(session_dir, "events.jsonl"), "r") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    audio_path = os.path.join(session_dir, "audio.f32")
+    if os.path.exists(audio_path) and os.path.getsize(audio_path) > 0:
+        audio = np.memmap(audio_path, dtype=np.float32, mode="r")
+    else:
+        audio = np.zeros(0, dtype=np.float32)
+    return events, audio
@@ -0,0 +1,176 @@
+import numpy as np
+
+# Local offset direction for each relative direction, for the user "front" is -z
+DIRECTIONS = {
+    "front": np.array([0.0, 0.0, 1.0]),
+    "back": np.array([0.0, 0.0, -1.0]),
+    "right": np.array([1.0, 0.0, 0.0]),
+    "left": np.array([-1.0, 0.0, 0.0]),
+    "up": np.array([0.0, 1.0, 0.0]),
+    "down": np.array([0.0, -1.0, 0.0]),
+}
+# Objects are never placed below this height
+MIN_HEIGHT = 0.5
+# Half size assumed for objects without known bounds
+DEFAULT_HALF_SIZE = np.array([0.25, 0.25, 0.25])
+# Size of the cells of the spatial grid, in meters
+CELL_SIZE = 1.0
+# Free space searched around the target position: number of rings and candidates per ring
+SEARCH_RINGS = 6
+SEARCH_ANGLES = 12
+
+
+def parse_vector(value):
+    """
+    Parse a position or rotation as sent by the client or stored in the scene.
+    Args:
+        value (dict or str or list): {"x", "y", "z"} dict, "x y z" string or [x, y, z] list.
+    Returns:
+        np.ndarray or None: The vector, or None if it cannot be parsed.
+    """
+    try:
+        if isinstance(value, dict):
+            return np.array([value["x"], value["y"], value["z"]], dtype=float)
+        if isinstance(value, str):
+            return np.array(value.split(), dtype=float)[:3]
+        if isinstance(value, (list, tuple)):
+            return np.array(value, dtype=float)[:3]
+    except (KeyError, ValueError, TypeError):
+        pass
+    return None
+
+
+def rotation_matrix(rotation):
+    """
+    Build the rotation matrix of an A-Frame rotation (degrees, Euler order YXZ).
+    Args:
+        rotation (np.ndarray or None): Rotation in degrees around x, y and z.
+    Returns:
+        np.ndarray: 3x3 rotation matrix.
+    """
+    if rotation is None:
+        return np.eye(3)
+    x, y, z = np.radians(rotation)
+    rx = np.array([[1, 0, 0], [0, np.cos(x), -np.sin(x)], [0, np.sin(x), np.cos(x)]])
+    ry = np.array([[np.cos(y), 0, np.sin(y)], [0, 1, 0], [-np.sin(y), 0, np.cos(y)]])
+    rz = np.array([[np.cos(z), -np.sin(z), 0], [np.sin(z), np.cos(z), 0], [0, 0, 1]])
+    return ry @ rx @ rz
+
+
+class SpatialGrid:
+    """
+    Uniform grid over the horizontal plane indexing object centers and half sizes,
+    used to find the objects close to a set of candidate positions.
+    """
+
+    def __init__(self, centers, half_sizes, cell_size=CELL_SIZE):
+        self.centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        self.half_sizes = np.asarray(half_sizes, dtype=float).reshape(-1, 3)
+        self.cell_size = cell_size
+        self.cells = {}
+        for index, cell in enumerate(map(tuple, self._cells(self.centers))):
+            self.cells.setdefault(cell, []).append(index)
+
+    def _cells(self, points):
+        return np.floor(points[:, [0, 2]] / self.cell_size).astype(int)
+
+    def neighbors(self, points, radius):
+        """
+        Get the indices of the objects in the cells within radius of the points.
+        Args:
+            points (np.ndarray): N x 3 array of positions.
+            radius (float): Search radius, in meters.
+        Returns:
+            np.ndarray: Indices of the nearby objects.
+        """
+        reach = int(np.ceil(radius / self.cell_size))
+        low = self._cells(points).min(axis=0) - reach
+        high = self._cells(points).max(axis=0) + reach
+        indices = []
+        for cell_x in range(low[0], high[0] + 1):
+            for cell_z in range(low[1], high[1] + 1):
+                indices.extend(self.cells.get((cell_x, cell_z), []))
+        return np.array(indices, dtype=int)
+
+    def collides(self, points, half_size):
+        """
+        Check which candidate positions overlap an indexed object.
+        Args:
+            points (np.ndarray): N x 3 array of candidate positions.
+            half_size (np.ndarray): Half size of the object being placed.
+        Returns:
+            np.ndarray: Boolean array, True for the candidates that overlap.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        indices = self.neighbors(points, float(np.max(self.half_sizes, initial=0) + np.max(half_size)))
+        if len(indices) == 0:
+            return np.zeros(len(points), dtype=bool)
+        # Axis-aligned box overlap between every candidate and every nearby object
+        gap = np.abs(points[:, None, :] - self.centers[None, indices, :])
+        limit = self.half_sizes[None, indices, :] + half_size[None, None, :]
+        return np.any(np.all(gap < limit, axis=2), axis=1)
+
+
+def node_half_size(node):
+    size = parse_vector(node.get("size")) if isinstance(node, dict) else None
+    return size / 2 if size is not None else DEFAULT_HALF_SIZE
+
+
+def resolve_position(reference_id, direction, distance, semantic_graph, scene_models=(), exclude_id=None):
+    """
+    Resolve a placement relative to a reference object or the user, like the client's getOffsetPosition,
+    moving it to the closest free spot when it would overlap another object.
+    Args:
+        reference_id (str): ID of the reference object, or "user".
+        direction (str): One of front, back, left, right, up, down.
+        distance (float): Distance to the reference, in meters.
+        semantic_graph (list): Nodes of the scene as sent by the client.
+        scene_models (list): Stored records of the scene, including objects not yet seen by the client.
+        exclude_id (str or None): ID of the object being placed, ignored as an obstacle.
+    Returns:
+        str or None: The position as "x y z", or None if the reference is unknown.
+    """
+    nodes = {node["id"]: node for node in scene_models or [] if isinstance(node, dict) and "id" in node}
+    nodes.update({node["id"]: node for node in semantic_graph or [] if isinstance(node, dict) and "id" in node})
+
+    reference = nodes.get(reference_id)
+    reference_position = parse_vector(reference.get("position")) if reference else None
+    if reference_position is None or direction not in DIRECTIONS:
+        return None
+
+    # Offset in the reference's local space, rotated to world space
+    offset = DIRECTIONS[direction] * float(distance)
+    if reference_id == "user" and direction in ("front", "back"):
+        offset = -offset
+    target = reference_position + rotation_matrix(parse_vector(reference.get("rotation"))) @ offset
+
+    # Keep the object above the ground, objects in front of the user at a fixed height
+    target[1] = MIN_HEIGHT if reference_id == "user" else max(target[1], MIN_HEIGHT)
+
+    # Index the other objects, the reference is ignored so objects can be placed on or under it
+    obstacles = [node for node_id, node in nodes.items() if node_id not in ("user", reference_id, exclude_id)]
+    centers, half_sizes = [], []
+    for node in obstacles:
+        position = parse_vector(node.get("position"))
+        if position is not None:
+            centers.append(position)
+            half_sizes.append(node_half_size(node))
+    if not centers:
+        return " ".join(str(value) for value in target)
+
+    half_size = DEFAULT_HALF_SIZE
+    grid = SpatialGrid(centers, half_sizes)
+    if not grid.collides(target, half_size)[0]:
+        return " ".join(str(value) for value in target)
+
+    # Search rings of candidates around the target on the horizontal plane, closest first
+    step = 2 * half_size[0]
+    radii = np.repeat(np.arange(1, SEARCH_RINGS + 1) * step, SEARCH_ANGLES)
+    angles = np.tile(np.linspace(0, 2 * np.pi, SEARCH_ANGLES, endpoint=False), SEARCH_RINGS)
+    candidates = np.repeat(target[None, :], len(radii), axis=0)
+    candidates[:, 0] += radii * np.cos(angles)
+    candidates[:, 2] += radii * np.sin(angles)
+    free = np.flatnonzero(~grid.collides(candidates, half_size))
+    if len(free) > 0:
+        target = candidates[free[0]]
+    return " ".join(str(value) for value in target)
@@ -149,7 +149,7 @@ async def classify_task(task, semantic_graph, clarification=""):
         {"role": "system", "content": "You are an AI assistant designed to classify tasks based on user requests and the current scene."},
         {"role": "user", "content": prompt}
     ]
-    response = await qwen_model(messages)
+    response = await qwen_model(messages, stage="classify_task")
     print("\nResponse: ")
     print(json.loads(response))
     return json.loads(response)
\ No newline at end of file
@@ -43,7 +43,7 @@ async def divide_tasks(question):
         {"role": "system", "content": "You are an AI assistant designed to help users break down complex questions into manageable tasks in a VR environment."},
         {"role": "user", "content": prompt}
     ]
-    response = await qwen_model(messages)
+    response = await qwen_model(messages, stage="divide_tasks")
     tasks = [task.strip() for task in response.strip("[]").split(",")]
     return tasks
 
@@ -79,5 +79,5 @@ async def reviewer_tasks(question, tasks):
         {"role": "user", "content": prompt}
     ]
     
-    feedback = await qwen_model(messages)
+    feedback = await qwen_model(messages, stage="reviewer_tasks")
     return feedback.strip()
\ No newline at end of file
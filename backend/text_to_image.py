@@ -1,19 +1,45 @@
+import threading
 import torch
 from io import BytesIO
 from diffusers import StableDiffusionPipeline
 
+from tracing import traced
+
 device = "cuda" if torch.cuda.is_available() else "cpu"
-# Load the Stable Diffusion pipeline
-sd_pipe = StableDiffusionPipeline.from_pretrained("stabilityai/stable-diffusion-2", torch_dtype=torch.float16, cache_dir="/mnt/shared_models/huggingface/cache/hub")
-sd_pipe = sd_pipe.to(device)
+# Stable Diffusion pipeline, loaded on first use
+sd_pipe = None
+# The pipeline's scheduler is stateful, so concurrent requests run one at a time
+sd_lock = threading.Lock()
+# Generation settings, the draft profile trades quality for speed when the server is overloaded.
+# It keeps the default 768x768 resolution, which the image-to-3D step expects, and only runs fewer steps
+SD_PROFILES = {
+    "default": {},
+    "draft": {"num_inference_steps": 20},
+}
+
+
+def load_sd_pipe():
+    """
+    Load the Stable Diffusion pipeline if it is not loaded yet.
+    Returns:
+        StableDiffusionPipeline: The loaded pipeline.
+    """
+    global sd_pipe
+    with sd_lock:
+        if sd_pipe is None:
+            sd_pipe = StableDiffusionPipeline.from_pretrained("stabilityai/stable-diffusion-2", torch_dtype=torch.float16, cache_dir="/mnt/shared_models/huggingface/cache/hub")
+            sd_pipe = sd_pipe.to(device)
+    return sd_pipe
 
 
-def generate_image(object_name, object_id):
+@traced("generate_image")
+def generate_image(object_name, object_id, profile="default"):
     """
     Generate a stylized 3D render of the specified object using Stable Diffusion.
     Args:
         object_name (str): The name of the object to generate.
         object_id (str): The unique identifier for the object, used for saving the image.
+        profile (str): The generation settings, one of SD_PROFILES.
     Returns:
         list: List of bytes of the image.
         str: File path where the image is saved.
@@ -22,7 +48,9 @@ def generate_image(object_name, object_id):
     prompt = f"A stylized 3D render of a single entire {object_name}, centered, non-cropped, isolated on a plain background, realistic, high contrast game asset style, VR-ready, front 3/4 view."
     
     # Generate image
-    image = sd_pipe(prompt).images[0]
+    load_sd_pipe()
+    with sd_lock:
+        image = sd_pipe(prompt, **SD_PROFILES[profile]).images[0]
     # Save image to file
     image.save(f"../images/{object_id}.png".replace(" ", "_"))
 
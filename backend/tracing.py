@@ -0,0 +1,165 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Directory where the trace of each utterance is dumped
+TRACE_DIR = "../traces"
+# Number of recent durations kept per stage for the percentiles
+MAX_SAMPLES = 1000
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+stage_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+stage_counts = defaultdict(int)
+# Number of calls of each stage currently running or waiting, the queue depth of the stage
+stage_in_flight = defaultdict(int)
+samples_lock = threading.Lock()
+
+
+class Trace:
+    """Spans recorded while handling one utterance, identified by a request id."""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "start_time": self.start_time,
+            "duration": time.perf_counter() - self.start,
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+
+
+def record(stage, duration):
+    """
+    Record the duration of a stage in its histogram.
+    Args:
+        stage (str): Name of the stage.
+        duration (float): Duration in seconds.
+    """
+    with samples_lock:
+        stage_samples[stage].append(duration)
+        stage_counts[stage] += 1
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time a stage, recording it in the stage histograms and in the current trace.
+    Args:
+        stage (str): Name of the stage.
+        **attributes: Extra information stored with the span in the trace.
+    """
+    trace = current_trace.get()
+    with samples_lock:
+        stage_in_flight[stage] += 1
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        with samples_lock:
+            stage_in_flight[stage] -= 1
+        record(stage, duration)
+        if trace is not None:
+            trace.spans.append({
+                "stage": stage,
+                "start": start - trace.start,
+                "duration": duration,
+                "thread": threading.current_thread().name,
+                "error": error,
+                **attributes
+            })
+
+
+def traced(stage):
+    """
+    Decorator recording every call of a function, sync or async, as a span.
+    Args:
+        stage (str): Name of the stage.
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(request_id=None):
+    """
+    Start the trace of an utterance in the current context.
+    Args:
+        request_id (str or None): Id of the request, generated if not given.
+    Returns:
+        Trace: The started trace.
+    """
+    trace = Trace(request_id)
+    current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace):
+    """
+    Record the total duration of an utterance and dump its trace as JSON.
+    Args:
+        trace (Trace): The trace to finish.
+    Returns:
+        dict: The trace.
+    """
+    trace_data = trace.to_dict()
+    record("utterance", trace_data["duration"])
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(os.path.join(TRACE_DIR, f"{trace.request_id}.json"), "w") as f:
+            json.dump(trace_data, f, indent=2)
+    except OSError as e:
+        print(f"Error saving trace {trace.request_id}: {e}")
+    return trace_data
+
+
+def metrics():
+    """
+    Summarize the recent durations of every stage.
+    Returns:
+        dict: Count, calls in flight, mean and p50/p95/p99 durations (in seconds) per stage.
+    """
+    with samples_lock:
+        snapshot = {stage: (np.array(samples), stage_counts[stage], stage_in_flight.get(stage, 0))
+                    for stage, samples in stage_samples.items()}
+    summary = {}
+    for stage, (samples, count, in_flight) in sorted(snapshot.items()):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        summary[stage] = {
+            "count": count,
+            "in_flight": in_flight,
+            "mean": float(samples.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
+    return summary
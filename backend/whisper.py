@@ -1,5 +1,97 @@
+import os
+import threading
 import numpy as np
+import torch
+from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 
+from config import ASR_BACKEND, ASR_MODEL, ASR_ONNX_DIR, ASR_THREADS
+from tracing import traced
+
+CACHE_DIR = "/mnt/shared_models/huggingface/cache/hub"
+# Whisper pipeline for audio transcription, loaded on first use
+whisper_pipe = None
+whisper_lock = threading.Lock()
+
+
+def create_whisper_pipe(backend=ASR_BACKEND, model_id=ASR_MODEL, num_threads=ASR_THREADS):
+    """
+    Create a Whisper speech recognition pipeline.
+    Args:
+        backend (str): "transformers" (float16 on GPU, float32 on CPU), "int8" (dynamic int8 quantization on CPU)
+            or "onnx" (ONNX Runtime on CPU).
+        model_id (str): The Whisper model to load.
+        num_threads (int): Number of CPU threads used for inference, 0 keeps the default.
+    Returns:
+        Pipeline: The speech recognition pipeline.
+    """
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    if backend == "transformers" and torch.cuda.is_available():
+        device, torch_dtype = "cuda", torch.float16
+    else:
+        device, torch_dtype = "cpu", torch.float32
+
+    processor = AutoProcessor.from_pretrained(model_id, cache_dir=CACHE_DIR)
+    if backend == "onnx":
+        try:
+            import onnxruntime
+            from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        except ImportError:
+            raise ImportError("The onnx ASR backend requires onnxruntime and optimum: pip install optimum[onnxruntime]")
+        session_options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            session_options.intra_op_num_threads = num_threads
+        # Export the model once, then load the cached export
+        export_dir = os.path.join(ASR_ONNX_DIR, model_id.replace("/", "_"))
+        if os.path.exists(export_dir):
+            model = ORTModelForSpeechSeq2Seq.from_pretrained(export_dir, session_options=session_options)
+        else:
+            model = ORTModelForSpeechSeq2Seq.from_pretrained(model_id, export=True, session_options=session_options, cache_dir=CACHE_DIR)
+            model.save_pretrained(export_dir)
+    elif backend in ("transformers", "int8"):
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            model_id, # or "openai/whisper-large-v3" if you want to upgrade
+            torch_dtype=torch_dtype,
+            low_cpu_mem_usage=True,
+            use_safetensors=True,
+            cache_dir=CACHE_DIR
+        ).to(device)
+        if backend == "int8":
+            # Linear layers hold most of the weights and compute, quantize them to int8
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        raise ValueError(f"Unknown ASR backend: {backend}")
+
+    # Create pipeline with chunk processing
+    pipe_kwargs = {"torch_dtype": torch_dtype, "device": device} if backend != "onnx" else {}
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        max_new_tokens=128,
+        chunk_length_s=5,  # Process in 5-second chunks
+        batch_size=16,
+        **pipe_kwargs
+    )
+
+
+def load_whisper_pipe():
+    """
+    Load the Whisper pipeline configured in config.py if it is not loaded yet.
+    Returns:
+        Pipeline: The loaded pipeline.
+    """
+    global whisper_pipe
+    with whisper_lock:
+        if whisper_pipe is None:
+            print(f"Loading {ASR_MODEL} with the {ASR_BACKEND} ASR backend...")
+            whisper_pipe = create_whisper_pipe()
+    return whisper_pipe
+
+
+@traced("transcribe_audio")
 def transcribe_audio(audio_data, pipe):
     """
     Transcribe audio data using the Whisper model.
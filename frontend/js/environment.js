@@ -1,5 +1,9 @@
 let pointingActive = false;
 let pointingType = null;
+// Pointing prompts waiting for an answer, by request id, shown one at a time in the order they arrived
+const pendingPointing = new Map();
+// Request id of the prompt being shown, echoed back so the server can match the answer
+let pointingRequestId = null;
 const rightHand = document.querySelector('#rightHand');
 const vrInstructions = document.querySelector('#pointing-instructions-text');
 
@@ -64,14 +68,21 @@ function getOffsetPosition(referenceEl, direction, distance = 1) {
 function getSemanticGraph(objectEls, cameraEl) {
     const graph = [];
 
-    // Add camera/user node
-    const userPos = cameraEl.getAttribute('position');
+    // Add camera/user node with its world pose, used by the backend to resolve placements
+    const userPos = cameraEl.object3D.getWorldPosition(new THREE.Vector3());
+    const userQuat = cameraEl.object3D.getWorldQuaternion(new THREE.Quaternion());
+    const userRot = new THREE.Euler().setFromQuaternion(userQuat, 'YXZ');
 
     graph.push({
         id: 'user',
         name: 'user',
         color: 'none',
-        position: userPos
+        position: { x: userPos.x, y: userPos.y, z: userPos.z },
+        rotation: {
+            x: THREE.MathUtils.radToDeg(userRot.x),
+            y: THREE.MathUtils.radToDeg(userRot.y),
+            z: THREE.MathUtils.radToDeg(userRot.z)
+        }
     });
 
     // Add all objects
@@ -80,12 +91,16 @@ function getSemanticGraph(objectEls, cameraEl) {
         if (!semanticNode) return;
         const [name, color] = semanticNode.split(';').map(s => s.split(':')[1].trim());
 
+        // Bounding box size, used by the backend to avoid overlapping placements
+        const size = new THREE.Box3().setFromObject(el.object3D).getSize(new THREE.Vector3());
+
         graph.push({
             id: el.id,
             name: name,
             color: color,
             position: el.getAttribute('position'),
-            rotation: el.getAttribute('rotation')
+            rotation: el.getAttribute('rotation'),
+            size: { x: size.x, y: size.y, z: size.z }
         });
     });
 
@@ -126,42 +141,90 @@ function getVisibleObjects(cameraEl, objectEls) {
     return visibleObjects;
 }
 
-// Generates unique IDs to objects based on their semantic name and keeps a count
-// This avoids duplicate IDs when multiple objects share the same name
-function generatedId(objectEls) {
-    const nameCounters = {};
-    objectEls.forEach(el => {
-        const semanticNode = el.getAttribute('semantic-node');
-        if (!semanticNode) return;
-        const [name, color] = semanticNode.split(';').map(s => s.split(':')[1].trim());
-        
-        // Initialize counter for this name if not already done
-        if (!nameCounters[name]) {
-            nameCounters[name] = 0;
-        }
-        // Increment the counter and assign a new ID
-        nameCounters[name]++;
-        el.id = `${name}${nameCounters[name]}`;
-    });
-    return nameCounters;
-    };
+// Scene sync state: last sent state of each node and sequence number of the last message
+let syncedNodes = new Map();
+let syncSeq = 0;
+let snapshotPending = true;
+
+// Key used to detect changed nodes, rounding numbers so small jitter is not sent
+function nodeKey(node) {
+    return JSON.stringify(node, (key, value) => typeof value === 'number' ? Math.round(value * 1000) / 1000 : value);
+}
 
-// Send environment data to the server
-function sendEnvironmentData(semanticGraph, nameCounters) {
+// Send the full semantic graph, on connection and whenever the server requests it
+function sendSceneSnapshot(semanticGraph) {
+    if (wsConnection.readyState !== WebSocket.OPEN) {
+        console.warn("WebSocket is not open.");
+        return;
+    }
+    syncSeq++;
     const message = {
         type: 'environment_data',
         semanticGraph: semanticGraph,
-        nameCounters: nameCounters
+        version: syncSeq
     };
+    wsConnection.send(JSON.stringify(message));
+    syncedNodes = new Map(semanticGraph.map(node => [node.id, nodeKey(node)]));
+    snapshotPending = false;
+}
 
-    if (wsConnection.readyState === WebSocket.OPEN) {
-        wsConnection.send(JSON.stringify(message));
-    } else {
+// Send only the nodes added, updated or removed since the last message
+function sendSceneDelta(semanticGraph) {
+    if (wsConnection.readyState !== WebSocket.OPEN) {
         console.warn("WebSocket is not open.");
+        return;
     }
+    const ops = [];
+    const currentIds = new Set();
+    semanticGraph.forEach(node => {
+        currentIds.add(node.id);
+        const key = nodeKey(node);
+        const previousKey = syncedNodes.get(node.id);
+        if (previousKey === undefined) {
+            ops.push({ op: 'add', node: node });
+        } else if (previousKey !== key) {
+            ops.push({ op: 'update', node: node });
+        }
+        syncedNodes.set(node.id, key);
+    });
+    syncedNodes.forEach((key, id) => {
+        if (!currentIds.has(id)) {
+            ops.push({ op: 'remove', id: id });
+            syncedNodes.delete(id);
+        }
+    });
+    // Nothing changed, nothing to send
+    if (ops.length === 0) return;
+
+    syncSeq++;
+    const message = {
+        type: 'scene_delta',
+        seq: syncSeq,
+        ops: ops
+    };
+    wsConnection.send(JSON.stringify(message));
 }
     
-// Backend triggers pointing mode
+// Backend asks the user to point, the prompt waits its turn if another one is being shown
+function requestPointing(requestId, type, text) {
+    pendingPointing.set(requestId, { type: type, text: text });
+    if (!pointingActive) showNextPointing();
+}
+
+// Shows the oldest pointing prompt still waiting for an answer
+function showNextPointing() {
+    const next = pendingPointing.entries().next();
+    if (next.done) {
+        pointingRequestId = null;
+        return;
+    }
+    const [requestId, prompt] = next.value;
+    pointingRequestId = requestId;
+    pointingType = prompt.type;
+    enablePointingMode(prompt.text);
+}
+
+// Shows a pointing prompt
 function enablePointingMode(customText) {
     pointingActive = true;
     // Enable raycaster on right hand
@@ -202,9 +265,11 @@ document.querySelector('#rightHand').addEventListener('triggerdown', function ()
             const message = {
                 type: (pointingType === 'object') ? 'pointing_object' : 'pointing_location',
                 position: { x: position.x, y: position.y + 0.4, z: position.z },
-                object_id: hitEl.id
+                object_id: hitEl.id,
+                request_id: pointingRequestId
             };
             wsConnection.send(JSON.stringify(message));
+            pendingPointing.delete(pointingRequestId);
             console.log("Sent pointing object message");
             console.log("Selected object:", message);
         }
@@ -214,18 +279,22 @@ document.querySelector('#rightHand').addEventListener('triggerdown', function ()
         // Send message to backend
         const message = {
             type: 'pointing_location',
-            position: { x: point.x, y: 0, z: point.z }
+            position: { x: point.x, y: 0, z: point.z },
+            request_id: pointingRequestId
         };
         wsConnection.send(JSON.stringify(message));
+        pendingPointing.delete(pointingRequestId);
         console.log("Selected location:", message);
         }
     } else {
         console.log("No target hit");
     }
     disablePointingMode();
+    // Move on to the next prompt, or show the same one again if nothing was selected
+    showNextPointing();
 });
 
-// Continuously updates and sends the environment state to the backend
+// Continuously keeps the environment state of the backend in sync
 AFRAME.registerComponent('update-environment', {
     init() {
         this.camera = document.querySelector('#camera');
@@ -246,9 +315,13 @@ AFRAME.registerComponent('update-environment', {
         this.camera.object3D.getWorldPosition(cameraPos);
         const scene = document.querySelector('a-scene');
         const objectEls = scene.querySelectorAll('[id][semantic-node]');
-        nameCounters = generatedId(objectEls);
         const visibleObjects = getVisibleObjects(this.camera, objectEls);
-        semanticGraph = getSemanticGraph(visibleObjects, this.camera);
-        sendEnvironmentData(semanticGraph, nameCounters);
+        const semanticGraph = getSemanticGraph(visibleObjects, this.camera);
+        // Send a full snapshot when needed, otherwise only what changed
+        if (snapshotPending) {
+            sendSceneSnapshot(semanticGraph);
+        } else {
+            sendSceneDelta(semanticGraph);
+        }
     }
 });
\ No newline at end of file
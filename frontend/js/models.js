@@ -1,13 +1,24 @@
 const loadedModels = new Set()
 let loadedModelsCount = 0
 let totalModels = 0
+// Keep downloaded files in memory so prefetched models are not requested again by the GLTF loader
+THREE.Cache.enabled = true;
 
 function loadInitialModels() {
-    // Fetch the models.json file and add each model to the scene
-    fetch("../../data/models.json")
-        .then(response => response.json())
+    // Fetch the scene manifest from the backend, falling back to the models.json file
+    const modelsFile = sceneId === "default" ? "../../data/models.json" : `../../data/scenes/${sceneId}/models.json`;
+    fetch(`${backendUrl}/scenes/${encodeURIComponent(sceneId)}/manifest`)
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(manifest => manifest.models)
+        .catch(() => fetch(modelsFile).then(response => response.ok ? response.json() : []))
         .then(models => {
         totalModels = models.length;
+        // An empty scene is ready straight away
+        if (totalModels === 0) {
+            document.querySelector('a-scene').dispatchEvent(new Event('all-models-loaded'));
+        }
+        // Download every model of the scene in parallel instead of one entity at a time
+        prefetchModels(models);
         models.forEach(model => {
             // Avoid adding duplicate models
             if (!loadedModels.has(model.id)) {
@@ -23,18 +34,83 @@ function loadInitialModels() {
     });
 }
 
+// Start downloading the files of the ready models, the GLTF loader then reads them from THREE.Cache
+function prefetchModels(models) {
+    const loader = new THREE.FileLoader().setResponseType("arraybuffer");
+    const urls = new Set(models.filter(model => !model.status || model.status === "ready").map(selectModelPath).filter(Boolean));
+    urls.forEach(url => loader.load(url, undefined, undefined, error => console.warn("Prefetch failed:", url, error)));
+}
+
+// URL of an asset served by the backend, from a content-hash URL of the manifest or a path of the scene records
+function assetUrl(path) {
+    if (!path) return path;
+    if (path.startsWith("/assets/")) return backendUrl + path;
+    return `${backendUrl}/assets/${path.replace(/^(\.\.\/)+/, "")}`;
+}
+
 // Add 3D model to the A-Frame scene
 function addModelToScene(model) {
+    // Models still being generated are shown as a lightweight placeholder
+    if (model.status && model.status !== "ready") {
+        addPlaceholderToScene(model);
+        return;
+    }
     const entity = document.createElement("a-entity");
     entity.setAttribute("id", model.id);
     entity.setAttribute("position", model.position);
     entity.setAttribute("rotation", model.rotation);
-    entity.setAttribute("gltf-model", model.path);
+    entity.setAttribute("gltf-model", selectModelPath(model));
     entity.setAttribute("mixin", "model");
     entity.setAttribute("semantic-node", `name: ${model.name}; color: ${model.color}`);
     document.querySelector("a-scene").appendChild(entity);
 }
 
+// Choose the level of detail to load: headsets get the first LOD variant, desktops the original
+function selectModelPath(model) {
+    const useLod = model.lods && model.lods.length > 0 && AFRAME.utils.device.isMobileVR();
+    // Manifest records carry content-hash URLs, which the browser can cache forever
+    if (model.url) {
+        return assetUrl(useLod && model.lod_urls.length > 0 ? model.lod_urls[0] : model.url);
+    }
+    return assetUrl(useLod ? model.lods[0] : model.path);
+}
+
+// Add a placeholder (low-poly box or billboard of the generated image) for a pending model
+function addPlaceholderToScene(model) {
+    const placeholder = model.placeholder || { type: "box" };
+    let entity;
+    if (placeholder.type === "image") {
+        entity = document.createElement("a-image");
+        entity.setAttribute("src", assetUrl(placeholder.src));
+    } else {
+        entity = document.createElement("a-box");
+        entity.setAttribute("scale", "0.5 0.5 0.5");
+        entity.setAttribute("material", "color: #cccccc; opacity: 0.5; transparent: true; wireframe: true");
+    }
+    entity.setAttribute("id", model.id);
+    entity.setAttribute("position", model.position);
+    entity.setAttribute("semantic-node", `name: ${model.name}; color: ${model.color}`);
+    document.querySelector("a-scene").appendChild(entity);
+}
+
+// Replace the placeholder of a pending model with an updated one
+function updatePlaceholderInScene(objectId, placeholder) {
+    const existingModel = document.getElementById(objectId);
+    if (!existingModel) return;
+    const [name, color] = existingModel.getAttribute("semantic-node").split(';').map(s => s.split(':')[1].trim());
+    const model = {
+        id: objectId,
+        name: name,
+        color: color,
+        position: existingModel.getAttribute("position"),
+        status: "pending",
+        placeholder: placeholder
+    };
+    deleteModelInScene(existingModel);
+    addPlaceholderToScene(model);
+    loadedModels.add(objectId);
+}
+
 // Remove 3D model from the A-Frame scene
 function deleteModelInScene(model) {
     // Find and remove the entity from the scene
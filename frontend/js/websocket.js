@@ -4,11 +4,16 @@ let wsConnection;
 const statusElement = document.getElementById('status');
 const micButton = document.getElementById('mic-button');
 const transcriptionElement = document.getElementById('transcription');
+// Scene to work on, selected with the "scene" URL parameter (e.g. app.html?scene=room1)
+const sceneId = new URLSearchParams(window.location.search).get('scene') || 'default';
+// Backend address, also serving the generated assets over HTTP
+const backendHost = 'localhost:8000';
+const backendUrl = `http://${backendHost}`;
 
 // Connect to WebSocket server
 function connectWebSocket() {
     // Server address
-    const wsUrl = 'ws://localhost:8000/ws';
+    const wsUrl = `ws://${backendHost}/ws?scene=${encodeURIComponent(sceneId)}`;
 
     // Create WebSocket connection
     wsConnection = new WebSocket(wsUrl);
@@ -17,6 +22,8 @@ function connectWebSocket() {
     wsConnection.onopen = () => {
         statusElement.textContent = 'Connected to server';
         micButton.disabled = false;
+        // A new connection starts with a full snapshot of the scene
+        snapshotPending = true;
         console.log('WebSocket connection established');
     };
 
@@ -26,6 +33,9 @@ function connectWebSocket() {
         micButton.disabled = true;
         micButton.classList.remove('listening');
         if (isRecording) stopRecording();
+        // Prompts of the closed connection can no longer be answered
+        pendingPointing.clear();
+        if (pointingActive) disablePointingMode();
         console.log('WebSocket connection closed');
         // Auto-reconnect after 3 seconds
         setTimeout(() => {
@@ -53,6 +63,11 @@ function connectWebSocket() {
             console.log('Received transcription:', transcription);
         }
 
+        // Server lost track of the scene version, send a full snapshot on the next tick
+        if (data.type === "request_snapshot") {
+            snapshotPending = true;
+        }
+
         // Calculate world position based on reference object
         if (data.type === "calculate_position") {
             // Extract parameters from message
@@ -66,7 +81,8 @@ function connectWebSocket() {
             console.log('Calculated world position:', worldPos);
             const message = {
                 type: 'world_position',
-                position: worldPos
+                position: worldPos,
+                request_id: data.request_id
         };
         // Send world position back to server
         wsConnection.send(JSON.stringify(message));
@@ -88,6 +104,31 @@ function connectWebSocket() {
         }
         }
 
+        // Generation progress of a model shown as a placeholder
+        if (data.type === "model_progress") {
+            statusElement.textContent = `${data.object_id}: ${data.stage.replace(/_/g, " ")}...`;
+            if (data.placeholder) {
+                updatePlaceholderInScene(data.object_id, data.placeholder);
+            }
+        }
+
+        // The server is overloaded and did not handle the utterance, or only the objects it could reuse
+        if (data.type === "utterance_complete" && (data.status === "rejected" || data.status === "partial")) {
+            statusElement.textContent = data.message || `Server busy, try again in ${data.retry_after} seconds`;
+        }
+
+        // Final model is ready, swap it in for the placeholder
+        if (data.type === "model_ready") {
+            const model = data.model;
+            const existingModel = document.getElementById(model.id);
+            if (existingModel) {
+                deleteModelInScene(existingModel);
+            }
+            addModelToScene(model);
+            loadedModels.add(model.id);
+            statusElement.textContent = 'Connected to server';
+        }
+
         if (data.type === "delete_object") {
             const objectId = data.object_id;
             const existingModel = document.getElementById(objectId);
@@ -102,15 +143,13 @@ function connectWebSocket() {
             // Prompt user to point to the specified object
             text = `Please point to the object you are referring to by ${data.disambiguation_phrase} from the following candidates: ${data.disambiguation_candidates}.`;
             console.log(text);
-            pointingType = "object";
-            enablePointingMode(text);
+            requestPointing(data.request_id, "object", text);
         }
         if (data.type === "start_pointing_location") {
             // Prompt user to point to the specified location
             text = `Please point to the location you are referring to by ${data.spatial_phrase}.`;
             console.log(text);
-            pointingType = "location";
-            enablePointingMode(text);
+            requestPointing(data.request_id, "location", text);
         }
     });
 }
\ No newline at end of file